@@ -0,0 +1,57 @@
+"""
+gunicorn settings for serving scamazon in production.
+
+    gunicorn -c gunicorn.conf.py
+
+(run from this directory, or pass --chdir). Everything can be overridden
+from the environment, see the variables below.
+
+Workers: one process per core times two, plus one (WEB_CONCURRENCY to
+override), each with GUNICORN_THREADS threads. The views are plain sync
+Django, so gthread over WSGI is the default; set GUNICORN_WORKER_CLASS to
+uvicorn.workers.UvicornWorker (pip install uvicorn) to serve scamazon.asgi
+instead.
+
+Reloading: the app is imported once in the master and forked (preload_app),
+which starts workers fast and shares memory between them. The catch is
+that `kill -HUP <master>` only restarts workers with the code the master
+already has. To deploy new code without dropping requests, send USR2 (a new
+master starts next to the old one, on the same socket), then WINCH and
+TERM to the old master once the new workers answer.
+"""
+
+import multiprocessing
+import os
+
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:%s' % os.environ.get('PORT', '8000'))
+
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+if worker_class.startswith('uvicorn'):
+    wsgi_app = 'scamazon.asgi:application'
+else:
+    wsgi_app = 'scamazon.wsgi:application'
+
+preload_app = True
+
+#a stuck request is killed after timeout; on a restart, in-flight requests get graceful_timeout to finish
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+#recycle workers now and then so slow leaks can't build up; the jitter keeps them from all restarting at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    #anything the master opened while preloading (a database connection) must not be shared by the workers
+    from django.db import connections
+    connections.close_all()
@@ -1,8 +1,9 @@
 from django.contrib import admin
 
-from .models import Book, Cart, Listing, CustomUser, Image, Order
+from .models import Book, Author, Cart, Listing, CustomUser, Image, Order
 
 admin.site.register(Book)
+admin.site.register(Author)
 admin.site.register(Cart)
 admin.site.register(Listing)
 admin.site.register(CustomUser)
@@ -0,0 +1,192 @@
+import bisect
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from .models import Book
+
+
+'''
+In-memory typeahead over book titles and authors.
+
+Every title/author is stored in sorted lists under lowercase keys: the whole
+label in one list and every later word of it in another (so "pot" finds
+"Harry Potter"). A prefix lookup is then a bisect plus a short scan, labels
+that start with the prefix first. The lists are built from the database on
+first use, patched by the Book signals in this process, and refreshed once
+they are older than AUTOCOMPLETE_MAX_AGE to pick up writes made by other
+worker processes. The refresh runs in a background thread and swaps the new
+lists in, so requests keep being answered from the old ones meanwhile.
+'''
+
+TITLE = 'title'
+AUTHOR = 'author'
+
+
+def _keys(label):
+    #the whole label, and every suffix that starts at a later word
+    text = ' '.join(label.lower().split())
+    words = []
+    for i, char in enumerate(text):
+        if char == ' ':
+            words.append(text[i + 1:])
+    return text, words
+
+
+def _load():
+    #everything build() needs, read without holding the lock
+    labels, words, titles, authors, author_counts = [], [], {}, {}, {}
+    for isbn, title, author in Book.objects.values_list('isbn', 'title', 'author').iterator(chunk_size=2000):
+        isbn = str(isbn)
+        titles[isbn] = title
+        authors[isbn] = author
+        text, suffixes = _keys(title)
+        labels.append((text, TITLE, title, isbn))
+        words.extend((key, TITLE, title, isbn) for key in suffixes)
+        author_counts[author] = author_counts.get(author, 0) + 1
+    for author in author_counts:
+        text, suffixes = _keys(author)
+        labels.append((text, AUTHOR, author, ''))
+        words.extend((key, AUTHOR, author, '') for key in suffixes)
+    #one sort is much cheaper than insort-ing every row
+    labels.sort()
+    words.sort()
+    return labels, words, titles, authors, author_counts
+
+
+class PrefixIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        #only one first build at a time; the requests waiting on it use its result
+        self.build_lock = threading.Lock()
+        self.refreshing = None
+        self.clear()
+
+    def clear(self):
+        self.labels = []
+        self.words = []
+        self.titles = {}
+        self.authors = {}
+        self.author_counts = {}
+        self.built_at = None
+        #changes made while a refresh is reading the database, replayed on top of it
+        self.pending = None
+
+    def _add(self, kind, label, isbn):
+        text, suffixes = _keys(label)
+        bisect.insort(self.labels, (text, kind, label, isbn))
+        for key in suffixes:
+            bisect.insort(self.words, (key, kind, label, isbn))
+
+    def _remove(self, kind, label, isbn):
+        text, suffixes = _keys(label)
+        for entries, keys in [(self.labels, [text]), (self.words, suffixes)]:
+            for key in keys:
+                entry = (key, kind, label, isbn)
+                i = bisect.bisect_left(entries, entry)
+                if i < len(entries) and entries[i] == entry:
+                    del entries[i]
+
+    def _add_author(self, author):
+        self.author_counts[author] = self.author_counts.get(author, 0) + 1
+        if self.author_counts[author] == 1:
+            self._add(AUTHOR, author, '')
+
+    def _remove_author(self, author):
+        self.author_counts[author] -= 1
+        if self.author_counts[author] == 0:
+            del self.author_counts[author]
+            self._remove(AUTHOR, author, '')
+
+    def build(self):
+        with self.lock:
+            self.pending = []
+        loaded = _load()
+        with self.lock:
+            pending = self.pending or []
+            self.labels, self.words, self.titles, self.authors, self.author_counts = loaded
+            self.pending = None
+            self.built_at = time.monotonic()
+            for change in pending:
+                change()
+
+    def _refresh(self):
+        try:
+            self.build()
+        finally:
+            connection.close()
+            self.refreshing = None
+
+    def refresh_in_background(self):
+        with self.lock:
+            if self.refreshing is not None:
+                return
+            self.refreshing = threading.Thread(target=self._refresh, daemon=True)
+        self.refreshing.start()
+
+    def is_stale(self):
+        return self.built_at is None or time.monotonic() - self.built_at > settings.AUTOCOMPLETE_MAX_AGE
+
+    def _change(self, change):
+        #nothing to patch until the index has been built, but a build under way gets it too
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append(change)
+            if self.built_at is not None:
+                change()
+
+    def update_book(self, book):
+        isbn, title, author = str(book.isbn), book.title, book.author
+
+        def change():
+            self._drop(isbn)
+            self.titles[isbn] = title
+            self.authors[isbn] = author
+            self._add(TITLE, title, isbn)
+            self._add_author(author)
+        self._change(change)
+
+    def remove_book(self, isbn):
+        isbn = str(isbn)
+        self._change(lambda: self._drop(isbn))
+
+    def _drop(self, isbn):
+        if isbn in self.titles:
+            self._remove(TITLE, self.titles.pop(isbn), isbn)
+            self._remove_author(self.authors.pop(isbn))
+
+    def _scan(self, entries, prefix, limit, results, seen):
+        i = bisect.bisect_left(entries, (prefix,))
+        while i < len(entries) and len(results) < limit:
+            key, kind, label, isbn = entries[i]
+            if not key.startswith(prefix):
+                break
+            if (kind, label, isbn) not in seen:
+                seen.add((kind, label, isbn))
+                results.append({'type': kind, 'label': label, 'isbn': isbn})
+            i += 1
+
+    def suggest(self, prefix, limit):
+        prefix = ' '.join(prefix.lower().split())
+        if not prefix:
+            return []
+        if self.built_at is None:
+            #nothing to answer from yet, so this request waits for the first build
+            with self.build_lock:
+                if self.built_at is None:
+                    self.build()
+        elif self.is_stale():
+            self.refresh_in_background()
+
+        results = []
+        seen = set()
+        with self.lock:
+            #labels that start with the prefix come before ones that only have a word starting with it
+            self._scan(self.labels, prefix, limit, results, seen)
+            self._scan(self.words, prefix, limit, results, seen)
+        return results
+
+
+index = PrefixIndex()
@@ -0,0 +1,94 @@
+import csv
+
+from django.db import transaction
+
+from .forms import ListingForm
+from .models import Book, Listing
+from .stats import record_catalog_change
+from . import caching
+
+
+'''
+Posting many listings at once from a CSV (isbn, quantity, price per row),
+used by the seller's bulk upload page and the import_listings command.
+
+Each row is checked with ListingForm, the same rules as add_listing. The
+ISBNs of a whole batch are looked up in one query, and the good rows are
+created with one bulk_create. The result is one report line per row
+saying which listing it became or why it was rejected.
+'''
+
+FIELDS = ['isbn', 'quantity', 'price']
+CREATED = 'created'
+REJECTED = 'rejected'
+
+
+class RowResult:
+    def __init__(self, line, isbn, status, listing_id=None, errors=()):
+        self.line = line
+        self.isbn = isbn
+        self.status = status
+        self.listing_id = listing_id
+        self.errors = list(errors)
+
+
+def read_rows(file):
+    #(line number, row) pairs from a CSV text file with a header row
+    reader = csv.DictReader(file)
+    missing = [field for field in FIELDS if field not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError("The CSV needs these columns: %s (missing %s)" % (', '.join(FIELDS), ', '.join(missing)))
+    for row in reader:
+        yield reader.line_num, row
+
+
+def _create_batch(seller, batch):
+    results = []
+    isbns = {form.cleaned_data['isbn'] for line, form in batch}
+    books = set(Book.objects.filter(isbn__in=isbns).values_list('isbn', flat=True))
+
+    created = []
+    for line, form in batch:
+        isbn = form.cleaned_data['isbn']
+        if isbn not in books:
+            results.append(RowResult(line, isbn, REJECTED, errors=["isbn: No book with this isbn, add the book first"]))
+            continue
+        listing = Listing(listingID=0, isbn_id=isbn, quantity=form.cleaned_data['quantity'],
+                          price=form.cleaned_data['price'], userID=seller)
+        result = RowResult(line, isbn, CREATED)
+        created.append((result, listing))
+        results.append(result)
+
+    listings = [listing for result, listing in created]
+    with transaction.atomic():
+        Listing.objects.bulk_create(listings)
+        #bulk_create skips the Listing signals, do what they would have done once for the batch
+        if listings:
+            record_catalog_change(listings=len(listings))
+        caching.invalidate(*{'book:%s' % listing.isbn_id for listing in listings})
+
+    #the primary keys are only known once the rows are in
+    for result, listing in created:
+        result.listing_id = listing.id
+    return results
+
+
+def create_listings(seller, rows, batch_size=1000):
+    '''
+    Creates a listing for every good row of rows ((line, dict) pairs) for
+    seller; yields a RowResult per row. Rows the form rejects come out as
+    soon as they are read, so sort by line to get them in file order.
+    '''
+    batch = []
+    for line, row in rows:
+        form = ListingForm({field: (row.get(field) or '').strip() for field in FIELDS})
+        if not form.is_valid():
+            yield RowResult(line, row.get('isbn'), REJECTED, errors=[
+                '%s: %s' % (field, ' '.join(messages)) for field, messages in form.errors.items()])
+            continue
+        batch.append((line, form))
+        if len(batch) >= batch_size:
+            yield from _create_batch(seller, batch)
+            batch = []
+    if batch:
+        yield from _create_batch(seller, batch)
@@ -0,0 +1,145 @@
+import hashlib
+import os
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    #not on Windows; the counters there are only as good as the backend's incr()
+    fcntl = None
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+'''
+Cache for the catalog pages (browse books/authors, author and book pages).
+
+What gets cached is the data a view looks up, not the HTML, since every page
+also carries the visitor's name, cart and CSRF token. Each entry remembers the
+tokens of the things it was built from, e.g. 'books' or 'listing:12'. A
+change sets a new token for those names (see signals.py, and touch_listings()
+for the stock updates that skip signals), and any entry built from an old
+token counts as a miss the next time it is read. Nothing relies on the
+timeout to go stale.
+
+Hits and misses are counted in the cache too, so with the file-based backend
+the numbers cover every worker (see stats()). That backend's incr() is a read
+and a write, so the workers take turns on a lock file in its directory.
+'''
+
+PREFIX = 'catalog:'
+EVERYTHING = 'everything'
+HITS = PREFIX + 'hits'
+MISSES = PREFIX + 'misses'
+#stamped by every invalidate(), whatever the names
+CHANGED = 'changed'
+
+
+def _digest(value):
+    return hashlib.md5(repr(value).encode()).hexdigest()
+
+def _token_key(name):
+    return PREFIX + 'token:' + _digest(name)
+
+@contextmanager
+def _counter_lock():
+    config = settings.CACHES['default']
+    if fcntl is None or not config['BACKEND'].endswith('FileBasedCache'):
+        #memcached, redis and local memory already add atomically
+        yield
+        return
+    os.makedirs(config['LOCATION'], exist_ok=True)
+    with open(os.path.join(config['LOCATION'], 'counters.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def _count(key):
+    with _counter_lock():
+        try:
+            cache.incr(key)
+        except ValueError:
+            #first count (or evicted), start it off
+            if not cache.add(key, 1, timeout=None):
+                cache.incr(key)
+
+
+def _stamps(keys):
+    #a token nobody has stamped yet (or that was evicted) gets one now, so every entry
+    #has a real stamp to compare and a later invalidate() always changes it
+    current = cache.get_many(keys)
+    missing = [key for key in keys if key not in current]
+    if missing:
+        for key in missing:
+            cache.add(key, uuid.uuid4().hex, timeout=None)
+        #add() keeps whatever another worker stamped first
+        current.update(cache.get_many(missing))
+    return current
+
+
+def cached(name, params, depends_on, compute, depends_on_value=None):
+    '''
+    Returns compute() for this view and params, from the cache while nothing
+    it depends on has changed. depends_on lists the names it was built from;
+    depends_on_value(value) can add names that are only known once it's built
+    (like the listings shown on a book page). params should be the cleaned
+    values the view works from, not raw query strings, so requests meaning the
+    same thing share an entry.
+    '''
+    key = PREFIX + name + ':' + _digest(params)
+    entry = cache.get(key)
+    if entry is not None:
+        value, tokens = entry
+        if cache.get_many(list(tokens)) == tokens:
+            _count(HITS)
+            return value
+    _count(MISSES)
+
+    #read the tokens before building, so a change made while we build leaves this entry stale rather than wrong
+    current = _stamps([_token_key(dependency) for dependency in [CHANGED, EVERYTHING] + list(depends_on)])
+    changed = current.pop(_token_key(CHANGED))
+    value = compute()
+    if depends_on_value is not None:
+        #these can only be read now, after the build; if anything at all changed meanwhile
+        #they may already be newer than value, so hand it out but don't keep it
+        current.update(_stamps([_token_key(dependency) for dependency in depends_on_value(value)]))
+        if cache.get(_token_key(CHANGED)) != changed:
+            return value
+    cache.set(key, (value, current), settings.CATALOG_CACHE_TIMEOUT)
+    return value
+
+
+def invalidate(*names):
+    '''Makes every entry built from any of these names stale.'''
+    def stamp():
+        cache.set_many({_token_key(name): uuid.uuid4().hex for name in names + (CHANGED,)}, timeout=None)
+
+    if names:
+        stamp()
+        #and again once the change is committed, in case a request read the old rows in between
+        transaction.on_commit(stamp)
+
+def invalidate_all():
+    #for bulk tools that write with update()/bulk_create and so skip the signals
+    invalidate(EVERYTHING)
+
+def touch_listings(listing_ids):
+    #stock changes made with queryset.update() (holds, checkout, returns) don't send signals
+    invalidate(*['listing:%s' % listing_id for listing_id in listing_ids])
+
+
+def stats():
+    counts = cache.get_many([HITS, MISSES])
+    hits = counts.get(HITS, 0)
+    misses = counts.get(MISSES, 0)
+    return {
+        'backend': settings.CACHES['default']['BACKEND'],
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+    }
@@ -0,0 +1,94 @@
+import datetime
+
+from django.db import transaction
+from django.db.models import Case, F, When
+
+from .models import Cart, Listing, Order
+from .stats import record_sales
+from . import caching
+
+
+class OutOfStock(Exception):
+    '''Raised when some cart items can't be bought; failures is a list of messages, one per item.'''
+
+    def __init__(self, failures):
+        super().__init__('; '.join(failures))
+        self.failures = failures
+
+
+def checkout_cart(user, address, payment):
+    '''
+    Turns the user's whole cart into orders in one transaction: either every
+    item is bought or nothing changes and OutOfStock says which items failed.
+    Runs a fixed number of queries however big the cart is.
+    '''
+    with transaction.atomic():
+        cart = list(Cart.objects.select_for_update().filter(userID=user).order_by('id'))
+        if not cart:
+            return []
+
+        #copies wanted per listing, and how many of those this cart already holds
+        wanted = {}
+        held = {}
+        for item in cart:
+            wanted[item.listingID_id] = wanted.get(item.listingID_id, 0) + item.quantity
+            held[item.listingID_id] = held.get(item.listingID_id, 0) + item.reserved
+
+        #lock the listings so two buyers can't both take the last copy; always in id order so
+        #two checkouts sharing listings queue up instead of deadlocking, and only the listing
+        #rows (of='self'), not the books joined in for their titles
+        listing_ids = list(wanted)
+        locked = Listing.objects.select_for_update(of=('self',)).select_related('isbn').filter(id__in=listing_ids).order_by('pk')
+        listings = {listing.id: listing for listing in locked}
+
+        failures = []
+        for listing_id, quantity in wanted.items():
+            listing = listings.get(listing_id)
+            if listing is None:
+                failures.append("Listing %s is no longer available" % listing_id)
+            elif listing.available() + held[listing_id] < quantity:
+                failures.append("Only %d of %s left (listing %d), you asked for %d" % (
+                    listing.available() + held[listing_id], listing.isbn, listing.id, quantity))
+        if failures:
+            raise OutOfStock(failures)
+
+        today = datetime.date.today()
+        orders = Order.objects.bulk_create([
+            Order(
+                date = today,
+                quantity = item.quantity,
+                book = listings[item.listingID_id].isbn,
+                price = listings[item.listingID_id].price,
+                buyer = user,
+                seller_id = listings[item.listingID_id].userID_id,
+                delivered = False,
+                address = address,
+                payment = payment,
+                oldListingId = item.listingID_id,
+                oldListingImage_id = listings[item.listingID_id].image_id,
+            )
+            for item in cart
+        ])
+
+        #decrease every listing by its cart amount (and drop our holds) in one UPDATE, then remove the sold out ones
+        Listing.objects.filter(id__in=listing_ids).update(
+            quantity=Case(
+                *[When(id=listing_id, then=F('quantity') - quantity) for listing_id, quantity in wanted.items()],
+                default=F('quantity'),
+            ),
+            reserved=Case(
+                *[When(id=listing_id, then=F('reserved') - amount) for listing_id, amount in held.items()],
+                default=F('reserved'),
+            ),
+            version=F('version') + 1,
+        )
+        caching.touch_listings(listing_ids)
+        if Listing.objects.filter(id__in=listing_ids, quantity__lt=0).exists():
+            #only reachable on databases without row locks (sqlite) when another checkout got in first
+            raise OutOfStock(["Some items sold out while you were checking out"])
+        Listing.objects.filter(id__in=listing_ids, quantity=0).delete()
+
+        Cart.objects.filter(id__in=[item.id for item in cart]).delete()
+        record_sales(orders)
+
+    return orders
@@ -0,0 +1,60 @@
+import csv
+import json
+
+from django.conf import settings
+
+from .models import Book, Listing, Order
+
+
+'''
+Streaming dumps of the catalog and orders as CSV or JSONL, used by the
+export_data command and the seller's order download.
+
+Rows come from values_list(...).iterator(chunk_size), so only one chunk of
+plain tuples is in memory at a time (a server side cursor on Postgres) and
+the output is produced line by line as it is read. No model instances are
+built and nothing is collected first, so a dump of millions of rows runs in
+the same memory as one of ten.
+'''
+
+#columns per table; payment details are never exported
+TABLES = {
+    'books': (Book.objects.order_by('isbn'),
+              ['isbn', 'title', 'author', 'pages', 'rating', 'description']),
+    'listings': (Listing.objects.order_by('id'),
+                 ['id', 'isbn', 'userID', 'quantity', 'reserved', 'price', 'image']),
+    'orders': (Order.objects.order_by('id'),
+               ['id', 'date', 'book', 'quantity', 'price', 'buyer', 'seller', 'delivered', 'returned', 'oldListingId']),
+}
+
+#what a seller gets for their own orders: enough to ship them
+SELLER_ORDER_FIELDS = ['id', 'date', 'book', 'book__title', 'quantity', 'price', 'buyer__username', 'address', 'delivered', 'returned']
+
+
+class Echo:
+    #csv.writer wants a file; this one hands each line straight back
+    def write(self, value):
+        return value
+
+
+def csv_lines(fields, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
+
+def jsonl_lines(fields, rows):
+    for row in rows:
+        #dates and decimals as strings
+        yield json.dumps(dict(zip(fields, row)), default=str) + '\n'
+
+FORMATS = {
+    'csv': (csv_lines, 'text/csv'),
+    'jsonl': (jsonl_lines, 'application/x-ndjson'),
+}
+
+
+def export_lines(queryset, fields, file_format, chunk_size=None):
+    '''Yields the rows of queryset as lines of text in file_format, one chunk of rows read at a time.'''
+    rows = queryset.values_list(*fields).iterator(chunk_size=chunk_size or settings.EXPORT_CHUNK_SIZE)
+    return FORMATS[file_format][0](fields, rows)
@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from .models import CustomUser
+from .isbn import normalize_isbn, isbn_key
 
 TYPES =( 
     ("Buyer", "Buyer"), 
@@ -20,6 +21,33 @@ class SignupForm(UserCreationForm):
         model = CustomUser
         fields = ('username', 'email', 'type', 'password1', 'password2')
 
+class IsbnField(forms.CharField):
+    '''
+    An ISBN typed any way (dashes, spaces, ISBN-10), cleaned to the key books
+    are stored under. With strict=False a value that isn't a valid ISBN is
+    still accepted as typed, for looking up older books.
+    '''
+    def __init__(self, *, strict=True, **kwargs):
+        self.strict = strict
+        super().__init__(**kwargs)
+
+    def to_python(self, value):
+        value = super().to_python(value)
+        if value in self.empty_values:
+            return value
+        if not self.strict:
+            return isbn_key(value)
+        try:
+            return normalize_isbn(value)
+        except ValueError:
+            raise forms.ValidationError("Enter a valid ISBN-10 or ISBN-13", code='invalid')
+
+    def widget_attrs(self, widget):
+        #max_length applies once the separators are gone, so let people type them
+        attrs = super().widget_attrs(widget)
+        attrs.pop('maxlength', None)
+        return attrs
+
 class CheckoutForm(forms.Form):
     address = forms.CharField(max_length=30)
     paymentType = forms.ChoiceField(choices=paytypes)
@@ -28,15 +56,30 @@ class CheckoutForm(forms.Form):
     Expiration = forms.CharField(max_length=12)
     
 class ListingForm(forms.Form):
-    isbn = forms.CharField(max_length=13)
+    isbn = IsbnField(max_length=13, strict=False)
     quantity = forms.IntegerField(initial= 1, min_value=1, max_value=99)
     price = forms.FloatField(initial= 9.99, min_value=1)
     image = forms.ImageField(required=False)
 
+class BulkListingForm(forms.Form):
+    file = forms.FileField(help_text="CSV with a header row of isbn,quantity,price")
+
 class BookForm(forms.Form):
     title = forms.CharField(max_length=200)
     author = forms.CharField(max_length=200)
-    isbn = forms.CharField(max_length=13)
+    isbn = IsbnField(max_length=13)
     pages = forms.IntegerField(initial=100, min_value=1)
     rating = forms.FloatField(initial=2.5, min_value=0, max_value=5)
     description = forms.CharField(max_length = 1500, required=False)
+
+ORDER_STATUSES = (
+("", "Any"),
+("undelivered", "Waiting for delivery"),
+("delivered", "Delivered"),
+("returned", "Returned"),
+)
+
+class OrderFilterForm(forms.Form):
+    status = forms.ChoiceField(choices=ORDER_STATUSES, required=False)
+    start = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    end = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
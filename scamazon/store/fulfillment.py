@@ -0,0 +1,78 @@
+from django.db import transaction
+from django.db.models import Case, F, When
+
+from .models import Listing, Order
+from .stats import record_deliveries, record_returns, record_catalog_change
+from . import caching
+
+
+'''
+Delivering and returning orders, one or many at a time.
+
+Both take the ids the user picked and quietly skip any that aren't theirs or
+are no longer open (already delivered or returned), so a double submit does
+nothing the second time. Each call is one transaction with a fixed number of
+queries however many orders are picked.
+'''
+
+def _open_orders(ids, **owner):
+    #lock the picked orders that are still open so two requests can't both act on them
+    return list(Order.objects.select_for_update().filter(id__in=ids, delivered=False, returned=False, **owner).order_by('id'))
+
+
+def deliver_orders(seller, ids):
+    '''Marks the seller's picked orders delivered; returns the orders that changed.'''
+    with transaction.atomic():
+        orders = _open_orders(ids, seller=seller)
+        if not orders:
+            return []
+        Order.objects.filter(id__in=[order.id for order in orders]).update(delivered=True)
+        record_deliveries(orders)
+    return orders
+
+
+def return_orders(buyer, ids):
+    '''
+    Marks the buyer's picked orders returned and puts the copies back on sale:
+    listings that still exist get their quantity back in one UPDATE, listings
+    that sold out (and were deleted) are created again with their old id.
+    Returns the orders that changed.
+    '''
+    with transaction.atomic():
+        orders = _open_orders(ids, buyer=buyer)
+        if not orders:
+            return []
+        Order.objects.filter(id__in=[order.id for order in orders]).update(returned=True)
+
+        restock = {}
+        first = {}
+        for order in orders:
+            restock[order.oldListingId] = restock.get(order.oldListingId, 0) + order.quantity
+            first.setdefault(order.oldListingId, order)
+
+        existing = set(Listing.objects.select_for_update().filter(id__in=list(restock)).values_list('id', flat=True))
+        if existing:
+            Listing.objects.filter(id__in=existing).update(quantity=Case(
+                *[When(id=listing_id, then=F('quantity') + restock[listing_id]) for listing_id in existing],
+                default=F('quantity'),
+            ), version=F('version') + 1)
+        recreated = Listing.objects.bulk_create([
+            Listing(
+                id = listing_id,
+                listingID = 0,
+                isbn_id = first[listing_id].book_id,
+                quantity = quantity,
+                userID_id = first[listing_id].seller_id,
+                price = first[listing_id].price,
+                image_id = first[listing_id].oldListingImage_id,
+            )
+            for listing_id, quantity in restock.items() if listing_id not in existing
+        ])
+
+        #bulk_create and update() skip the Listing signals
+        if recreated:
+            record_catalog_change(listings=len(recreated))
+        caching.touch_listings(restock)
+        caching.invalidate(*['book:%s' % first[listing_id].book_id for listing_id in restock if listing_id not in existing])
+        record_returns(orders)
+    return orders
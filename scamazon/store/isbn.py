@@ -0,0 +1,74 @@
+import re
+
+
+'''
+ISBN handling, so a book is found however its ISBN is typed.
+
+Books are stored under the 13 digit form with no separators. People type
+"978-0-306-40615-7", "0 306 40615 2" or the old 10 digit form of the same
+book, so every ISBN is normalized before it is written (BookForm) and before
+it is looked up (book, search, add_listing), which keeps each lookup a
+single primary key hit.
+
+Keys that aren't valid ISBNs (older rows and test data) are still looked up,
+as typed minus separators; only new books have to pass the checksum.
+'''
+
+SEPARATORS_RE = re.compile(r'[\s\-\u2010-\u2015.]')
+ISBN10_RE = re.compile(r'^[0-9]{9}[0-9X]$')
+ISBN13_RE = re.compile(r'^97[89][0-9]{10}$')
+
+
+def strip_isbn(value):
+    #drop spaces, dashes and dots, and accept a lower case x check digit
+    return SEPARATORS_RE.sub('', str(value)).upper()
+
+def isbn10_check_digit(digits):
+    #digits are the first 9; weights 10 down to 2, mod 11
+    check = (11 - sum((10 - i) * int(d) for i, d in enumerate(digits[:9])) % 11) % 11
+    return 'X' if check == 10 else str(check)
+
+def isbn13_check_digit(digits):
+    #digits are the first 12; weights alternate 1 and 3, mod 10
+    return str((10 - sum((3 if i % 2 else 1) * int(d) for i, d in enumerate(digits[:12])) % 10) % 10)
+
+def is_isbn10(value):
+    return bool(ISBN10_RE.match(value)) and isbn10_check_digit(value) == value[-1]
+
+def is_isbn13(value):
+    return bool(ISBN13_RE.match(value)) and isbn13_check_digit(value) == value[-1]
+
+def to_isbn13(isbn10):
+    digits = '978' + isbn10[:9]
+    return digits + isbn13_check_digit(digits)
+
+def to_isbn10(isbn13):
+    #only 978 ISBNs have a 10 digit form
+    if not isbn13.startswith('978'):
+        return None
+    digits = isbn13[3:12]
+    return digits + isbn10_check_digit(digits)
+
+
+def normalize_isbn(value):
+    '''Returns the 13 digit form of a valid ISBN-10 or ISBN-13; raises ValueError otherwise.'''
+    value = strip_isbn(value)
+    if is_isbn13(value):
+        return value
+    if is_isbn10(value):
+        return to_isbn13(value)
+    raise ValueError("%s is not a valid ISBN-10 or ISBN-13" % value)
+
+def isbn_key(value):
+    '''The primary key to look value up by: its 13 digit form if it is an ISBN, else value without separators.'''
+    try:
+        return normalize_isbn(value)
+    except ValueError:
+        return strip_isbn(value)
+
+def looks_like_isbn(value):
+    try:
+        normalize_isbn(value)
+    except ValueError:
+        return False
+    return True
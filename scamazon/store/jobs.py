@@ -0,0 +1,103 @@
+import datetime
+import traceback
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Job
+
+
+'''
+A small job queue kept in the database, for work that shouldn't slow down a
+request (like making thumbnails of an upload).
+
+enqueue() adds a Job row. The run_jobs command claims pending rows and runs
+them in a process pool. A job that raises is tried again later, with the wait
+doubling each time, until JOB_MAX_ATTEMPTS; then it is left as 'failed' with
+its error for someone to look at. Finished jobs are deleted.
+
+Claiming is one conditional UPDATE, so several workers can share the table
+without running a job twice. A worker that dies mid-job leaves its rows
+locked only until JOB_LOCK_SECONDS runs out, then another worker picks them up.
+'''
+
+handlers = {}
+failure_handlers = {}
+
+
+def handler(kind, on_failure=None):
+    '''
+    Registers the function that runs jobs of this kind; it gets the payload as
+    keyword arguments. on_failure(**payload) is called if the job runs out of attempts.
+    '''
+    def register(function):
+        handlers[kind] = function
+        if on_failure is not None:
+            failure_handlers[kind] = on_failure
+        return function
+    return register
+
+
+def enqueue(kind, **payload):
+    return Job.objects.create(kind=kind, payload=payload)
+
+
+def claim(limit, worker=None, now=None):
+    '''Marks up to limit runnable jobs as running for this worker and returns them.'''
+    now = now or timezone.now()
+    worker = worker or uuid.uuid4().hex
+    runnable = Job.objects.filter(status=Job.PENDING, run_after__lte=now) | \
+        Job.objects.filter(status=Job.RUNNING, locked_until__lt=now)
+    ids = list(runnable.order_by('run_after', 'id').values_list('id', flat=True)[:limit])
+    if not ids:
+        return []
+    #only rows nobody else claimed in the meantime still match
+    (Job.objects.filter(id__in=ids, status=Job.PENDING) | Job.objects.filter(id__in=ids, status=Job.RUNNING, locked_until__lt=now)).update(
+        status=Job.RUNNING,
+        claimed_by=worker,
+        locked_until=now + datetime.timedelta(seconds=settings.JOB_LOCK_SECONDS),
+    )
+    return list(Job.objects.filter(id__in=ids, claimed_by=worker, status=Job.RUNNING).order_by('id'))
+
+
+def perform(kind, payload):
+    #runs in a pool process: look the handler up there and let any exception travel back
+    return handlers[kind](**payload)
+
+
+def finish(job, error=None):
+    '''Records how a claimed job went: deleted when it worked, otherwise retried later or failed.'''
+    if error is None:
+        Job.objects.filter(id=job.id).delete()
+        return
+    attempts = job.attempts + 1
+    if attempts >= settings.JOB_MAX_ATTEMPTS:
+        status = Job.FAILED
+    else:
+        status = Job.PENDING
+    Job.objects.filter(id=job.id).update(
+        status=status,
+        attempts=attempts,
+        run_after=timezone.now() + datetime.timedelta(seconds=settings.JOB_RETRY_SECONDS * 2 ** (attempts - 1)),
+        locked_until=None,
+        claimed_by='',
+        last_error=error,
+    )
+    if status == Job.FAILED and job.kind in failure_handlers:
+        failure_handlers[job.kind](**job.payload)
+
+
+def run_inline(limit=100):
+    '''Runs the runnable jobs in this process, one after another; returns how many were run.'''
+    jobs = claim(limit)
+    for job in jobs:
+        try:
+            with transaction.atomic():
+                perform(job.kind, job.payload)
+        except Exception:
+            finish(job, traceback.format_exc())
+        else:
+            finish(job)
+    return len(jobs)
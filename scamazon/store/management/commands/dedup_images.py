@@ -0,0 +1,63 @@
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from store.models import Image, Listing, Order
+from store import caching
+
+
+class Command(BaseCommand):
+    help = "Hashes listing images uploaded before deduplication and merges the ones with identical files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be merged")
+
+    def handle(self, *args, **options):
+        groups = {}
+        missing = 0
+        for image in Image.objects.filter(sha256__isnull=True).order_by('id').iterator(chunk_size=options['batch_size']):
+            try:
+                with image.image.open('rb'):
+                    groups.setdefault(Image.file_sha256(image.image), []).append(image)
+            except (OSError, ValueError):
+                missing += 1
+                self.stderr.write("Image %d: can't read %s" % (image.id, image.image.name))
+        hashed = {image.sha256: image for image in Image.objects.filter(sha256__in=list(groups))}
+
+        merged = 0
+        for sha256, images in groups.items():
+            keeper = hashed.get(sha256) or images[0]
+            duplicates = [image for image in images if image.id != keeper.id]
+            merged += len(duplicates)
+            if not options['dry_run']:
+                self.merge(sha256, keeper, duplicates)
+
+        self.stdout.write(self.style.SUCCESS("Images: %d hashed, %d duplicates %s, %d unreadable" % (
+            sum(len(images) for images in groups.values()), merged, 'found' if options['dry_run'] else 'merged', missing)))
+
+    def merge(self, sha256, keeper, duplicates):
+        storage = keeper.image.storage
+        with transaction.atomic():
+            if keeper.sha256 is None:
+                #move the file to its content address, like new uploads
+                old_name = keeper.image.name
+                with keeper.image.open('rb'):
+                    keeper.image.name = storage.save(sha256 + os.path.splitext(old_name)[1].lower(), keeper.image)
+                keeper.sha256 = sha256
+                Image.objects.filter(id=keeper.id).update(image=keeper.image.name, sha256=sha256)
+                transaction.on_commit(lambda: storage.delete(old_name))
+
+            ids = [image.id for image in duplicates]
+            #point everything at the keeper before deleting, the foreign keys cascade
+            listing_ids = list(Listing.objects.filter(image_id__in=ids).values_list('id', flat=True))
+            Listing.objects.filter(id__in=listing_ids).update(image_id=keeper.id, version=F('version') + 1)
+            Order.objects.filter(oldListingImage_id__in=ids).update(oldListingImage_id=keeper.id)
+            for image in duplicates:
+                name = image.image.name
+                image.delete()
+                if name != keeper.image.name:
+                    transaction.on_commit(lambda name=name: storage.delete(name))
+            caching.touch_listings(listing_ids)
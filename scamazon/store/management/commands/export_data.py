@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.exports import TABLES, FORMATS, export_lines
+
+
+class Command(BaseCommand):
+    help = "Writes all books, listings or orders to a CSV or JSONL file, reading the table a chunk at a time"
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', choices=list(TABLES))
+        parser.add_argument('--format', choices=list(FORMATS), default='csv')
+        parser.add_argument('--output', '-o', default='-', help="File to write, - for stdout (the default)")
+        parser.add_argument('--chunk-size', type=int, help="Rows fetched per round trip, defaults to EXPORT_CHUNK_SIZE")
+
+    def handle(self, *args, **options):
+        queryset, fields = TABLES[options['table']]
+        if options['output'] == '-':
+            file = None
+        else:
+            try:
+                file = open(options['output'], 'w', newline='')
+            except OSError as error:
+                raise CommandError(error)
+
+        started = time.monotonic()
+        lines = 0
+        try:
+            for line in export_lines(queryset.all(), fields, options['format'], options['chunk_size']):
+                if file is None:
+                    self.stdout.write(line, ending='')
+                else:
+                    file.write(line)
+                lines += 1
+        finally:
+            if file is not None:
+                file.close()
+
+        rows = lines - 1 if options['format'] == 'csv' else lines
+        elapsed = time.monotonic() - started
+        #stderr, so it doesn't end up in a dump written to stdout
+        self.stderr.write(self.style.SUCCESS("Exported %d %s in %.1fs" % (rows, options['table'], elapsed)))
@@ -0,0 +1,123 @@
+import csv
+import io
+import json
+import sys
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from store.forms import BookForm
+from store.models import Book
+from store.search import index_books
+from store.stats import rebuild_catalog_stats
+from store import caching
+
+BOOK_FIELDS = list(BookForm.base_fields)
+
+
+def read_csv(file):
+    for row in csv.DictReader(file):
+        yield row
+
+def read_jsonl(file):
+    for line in file:
+        line = line.strip()
+        if line:
+            try:
+                row = json.loads(line)
+            except ValueError as error:
+                row = {'__error__': "not JSON: %s" % error}
+            yield row if isinstance(row, dict) else {'__error__': "not a JSON object"}
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl}
+
+
+class Command(BaseCommand):
+    help = "Adds or updates books from a CSV or JSONL file (one book per row, same fields and rules as the add book form)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, - for stdin")
+        parser.add_argument('--format', choices=list(READERS), help="Defaults to the file extension")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--rejects', help="Write rejected rows and why to this JSONL file")
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or options['path'].rsplit('.', 1)[-1].lower()
+        if file_format not in READERS:
+            raise CommandError("Can't tell the format of %s, pass --format" % options['path'])
+
+        if options['path'] == '-':
+            file = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+        else:
+            try:
+                file = open(options['path'], encoding='utf-8-sig', newline='')
+            except OSError as error:
+                raise CommandError(error)
+        rejects = open(options['rejects'], 'w') if options['rejects'] else None
+
+        started = time.monotonic()
+        read = imported = rejected = 0
+        batch = {}
+        try:
+            #only one batch is ever held in memory, however big the file is
+            for line, row in enumerate(READERS[file_format](file), start=1):
+                read += 1
+                book, errors = self.validate(row)
+                if errors:
+                    rejected += 1
+                    self.reject(rejects, line, row, errors)
+                    continue
+                #a later row for the same isbn wins, and one statement can't upsert a row twice
+                batch[book.isbn] = book
+                if len(batch) >= options['batch_size']:
+                    imported += self.save(batch.values())
+                    batch = {}
+            imported += self.save(batch.values())
+        finally:
+            file.close()
+            if rejects:
+                rejects.close()
+
+        #bulk_create skips the Book signals, so catch up everything they would have updated
+        #(the search index is written per batch above; the typeahead in running web
+        #processes reloads itself after AUTOCOMPLETE_MAX_AGE)
+        call_command('rebuild_authors', batch_size=options['batch_size'], stdout=io.StringIO())
+        rebuild_catalog_stats()
+        caching.invalidate_all()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            "Read %d rows: %d books imported, %d rejected in %.1fs (%.0f rows/s)" % (
+                read, imported, rejected, elapsed, read / elapsed if elapsed else read)
+        ))
+
+    def validate(self, row):
+        if '__error__' in row:
+            return None, {'row': [row['__error__']]}
+        form = BookForm({field: row.get(field) for field in BOOK_FIELDS})
+        if not form.is_valid():
+            return None, {field: list(messages) for field, messages in form.errors.items()}
+        return Book(**form.cleaned_data), None
+
+    def reject(self, rejects, line, row, errors):
+        if rejects:
+            rejects.write(json.dumps({'line': line, 'errors': errors, 'row': row}) + '\n')
+        else:
+            self.stderr.write("Row %d rejected: %s" % (line, '; '.join(
+                '%s: %s' % (field, ' '.join(messages)) for field, messages in errors.items())))
+
+    def save(self, books):
+        books = list(books)
+        if not books:
+            return 0
+        with transaction.atomic():
+            Book.objects.bulk_create(
+                books,
+                update_conflicts=True,
+                unique_fields=['isbn'],
+                update_fields=[field for field in BOOK_FIELDS if field != 'isbn'],
+            )
+            index_books(books)
+        return len(books)
@@ -0,0 +1,57 @@
+import io
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.bulk_listings import read_rows, create_listings, CREATED
+from store.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Adds listings for a seller from a CSV file with the columns isbn, quantity and price (the books must exist)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('seller', help="Username of the seller the listings belong to")
+        parser.add_argument('path', help="CSV file to import, - for stdin")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--report', help="Write the result of every row to this JSONL file")
+
+    def handle(self, *args, **options):
+        seller = CustomUser.objects.filter(username=options['seller']).first()
+        if seller is None:
+            raise CommandError("No user called %s" % options['seller'])
+
+        if options['path'] == '-':
+            file = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+        else:
+            try:
+                file = open(options['path'], encoding='utf-8-sig', newline='')
+            except OSError as error:
+                raise CommandError(error)
+        report = open(options['report'], 'w') if options['report'] else None
+
+        started = time.monotonic()
+        read = created = 0
+        try:
+            for result in create_listings(seller, read_rows(file), options['batch_size']):
+                read += 1
+                if result.status == CREATED:
+                    created += 1
+                elif not report:
+                    self.stderr.write("Row %d rejected: %s" % (result.line, '; '.join(result.errors)))
+                if report:
+                    report.write(json.dumps(vars(result)) + '\n')
+        except ValueError as error:
+            raise CommandError(error)
+        finally:
+            file.close()
+            if report:
+                report.close()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            "Read %d rows: %d listings created, %d rejected in %.1fs (%.0f rows/s)" % (
+                read, created, read - created, elapsed, read / elapsed if elapsed else read)
+        ))
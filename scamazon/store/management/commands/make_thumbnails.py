@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from store.models import Image
+from store.thumbnails import make_thumbnails
+
+
+class Command(BaseCommand):
+    help = "Makes the WebP/JPEG thumbnails for listing images that don't have them yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Remake them for every image")
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        images = Image.objects.order_by('id')
+        if not options['all']:
+            images = images.filter(variants={})
+
+        made = 0
+        failed = 0
+        for image in images.iterator(chunk_size=options['batch_size']):
+            if make_thumbnails(image):
+                made += 1
+            else:
+                failed += 1
+                self.stderr.write("Could not read image %d (%s)" % (image.id, image.image.name))
+
+        self.stdout.write(self.style.SUCCESS("Thumbnails: %d images done, %d failed" % (made, failed)))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Avg, Count
+
+from store.models import Author, Book
+from store import caching
+
+
+class Command(BaseCommand):
+    help = "Recomputes the Author summary table from the Book table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        existing = {author.name: author for author in Author.objects.all()}
+        slugs = {author.slug for author in existing.values()}
+
+        created = []
+        updated = []
+        seen = set()
+        stats = Book.objects.values('author').annotate(book_count=Count('isbn'), average_rating=Avg('rating')).order_by('author')
+        for row in stats.iterator(chunk_size=batch_size):
+            seen.add(row['author'])
+            average_rating = round(row['average_rating'], 2)
+            author = existing.get(row['author'])
+            if author is None:
+                #checked against the slugs in hand, including the ones about to be created
+                slug = Author.unique_slug(row['author'], taken=slugs.__contains__)
+                slugs.add(slug)
+                created.append(Author(name=row['author'], slug=slug, letter=Author.first_letter(row['author']), book_count=row['book_count'], average_rating=average_rating))
+            elif author.book_count != row['book_count'] or author.average_rating != average_rating:
+                author.book_count = row['book_count']
+                author.average_rating = average_rating
+                updated.append(author)
+
+        removed = [author.id for name, author in existing.items() if name not in seen]
+
+        with transaction.atomic():
+            Author.objects.bulk_create(created, batch_size=batch_size)
+            Author.objects.bulk_update(updated, ['book_count', 'average_rating'], batch_size=batch_size)
+            for start in range(0, len(removed), batch_size):
+                Author.objects.filter(id__in=removed[start:start + batch_size]).delete()
+
+        caching.invalidate_all()
+
+        self.stdout.write(self.style.SUCCESS(
+            "Authors: %d created, %d updated, %d removed" % (len(created), len(updated), len(removed))
+        ))
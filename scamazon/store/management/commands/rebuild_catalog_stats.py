@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from store.stats import rebuild_catalog_stats
+
+
+class Command(BaseCommand):
+    help = "Recounts the books, listings and sellers shown on the dashboards"
+
+    def handle(self, *args, **options):
+        counts = rebuild_catalog_stats()
+        self.stdout.write(self.style.SUCCESS(
+            "Catalog: %(books)d books, %(listings)d listings, %(sellers)d sellers" % counts
+        ))
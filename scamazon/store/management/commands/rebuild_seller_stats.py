@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.models import Order, SellerStats, SellerDailyStats
+from store.stats import aggregate_seller_stats, aggregate_daily_stats, lock_ledger
+
+
+def insert_in_batches(model, rows, batch_size):
+    #bulk_create would turn a generator into one big list first, so hand it one batch at a time
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(model(seller_id=row.pop('seller'), **row))
+        if len(batch) == batch_size:
+            model.objects.bulk_create(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch)
+        count += len(batch)
+    return count
+
+
+class Command(BaseCommand):
+    help = "Recomputes the seller stats ledger from the Order table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        orders = Order.objects.filter(seller__isnull=False)
+
+        #the whole swap happens in one transaction so the seller pages never see a half built ledger,
+        #and checkouts wait to record their sales until it is done
+        with transaction.atomic():
+            lock_ledger()
+            SellerStats.objects.all().delete()
+            SellerDailyStats.objects.all().delete()
+            sellers = insert_in_batches(SellerStats, aggregate_seller_stats(orders).iterator(chunk_size=batch_size), batch_size)
+            days = insert_in_batches(SellerDailyStats, aggregate_daily_stats(orders).iterator(chunk_size=batch_size), batch_size)
+
+        self.stdout.write(self.style.SUCCESS(
+            "Seller stats: %d sellers, %d days" % (sellers, days)
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from store.reservations import release_expired, repair_reserved
+
+
+class Command(BaseCommand):
+    help = "Gives back the stock held by carts whose hold has expired (run it every few minutes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        released = release_expired(batch_size=options['batch_size'])
+        repaired = repair_reserved()
+        self.stdout.write(self.style.SUCCESS("Released %d held copies, repaired %d listings" % (released, repaired)))
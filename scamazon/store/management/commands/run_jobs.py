@@ -0,0 +1,58 @@
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+
+from store import jobs
+
+
+class Command(BaseCommand):
+    help = "Runs queued background jobs (thumbnails etc) in a pool of worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help="How many jobs run at once; 0 runs them one by one in this process")
+        parser.add_argument('--once', action='store_true', help="Exit when there is nothing left to run")
+        parser.add_argument('--sleep', type=float, default=2, help="Seconds to wait when the queue is empty")
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        if processes <= 0:
+            done = self.run(options, lambda: jobs.run_inline())
+        else:
+            #spawned, not forked, so no process shares this one's database connection
+            with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup) as pool:
+                done = self.run(options, lambda: self.run_batch(pool, processes))
+        self.stdout.write(self.style.SUCCESS("Jobs: %d run" % done))
+
+    def run(self, options, run_batch):
+        done = 0
+        try:
+            while True:
+                ran = run_batch()
+                done += ran
+                if not ran:
+                    if options['once']:
+                        return done
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            return done
+
+    def run_batch(self, pool, processes):
+        #never claim more than there are processes, so claimed jobs don't sit waiting while their lock runs out
+        claimed = jobs.claim(processes)
+        futures = {pool.submit(jobs.perform, job.kind, job.payload): job for job in claimed}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                future.result()
+            except Exception:
+                jobs.finish(job, traceback.format_exc())
+                self.stderr.write("Job %d (%s) failed" % (job.id, job.kind))
+            else:
+                jobs.finish(job)
+        return len(claimed)
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.10 on 2026-10-18 14:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_order_oldlistingimage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['title', 'isbn'], name='book_title_isbn_idx'),
+        ),
+    ]
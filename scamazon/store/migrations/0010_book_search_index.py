@@ -0,0 +1,60 @@
+from django.db import migrations
+
+
+#a copy of the index as store/search.py made it at the time, so later changes there can't change this migration
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS store_book_fts USING fts5("
+            "isbn UNINDEXED, title, author, description, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        insert = "INSERT INTO store_book_fts (isbn, title, author, description) VALUES (%s, %s, %s, %s)"
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE TABLE IF NOT EXISTS store_book_search ("
+            "isbn varchar(13) PRIMARY KEY REFERENCES store_book(isbn) ON DELETE CASCADE, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS store_book_search_document_idx ON store_book_search USING gin(document)"
+        )
+        insert = (
+            "INSERT INTO store_book_search (isbn, document) VALUES (%s, "
+            "setweight(to_tsvector('english', %s), 'A') || "
+            "setweight(to_tsvector('english', %s), 'B') || "
+            "setweight(to_tsvector('english', %s), 'C')) "
+            "ON CONFLICT (isbn) DO UPDATE SET document = EXCLUDED.document"
+        )
+    else:
+        return
+
+    #index the books that already exist
+    Book = apps.get_model('store', 'Book')
+    rows = [
+        (str(isbn), title, author, description or '')
+        for isbn, title, author, description in Book.objects.using(schema_editor.connection.alias).values_list('isbn', 'title', 'author', 'description')
+    ]
+    if rows:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(insert, rows)
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS store_book_fts")
+    elif vendor == 'postgresql':
+        schema_editor.execute("DROP TABLE IF EXISTS store_book_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_book_title_isbn_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
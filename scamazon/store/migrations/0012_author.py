@@ -0,0 +1,49 @@
+# Generated by Django 4.2.10 on 2026-10-18 14:44
+
+from django.db import migrations, models
+from django.db.models import Avg, Count
+from django.utils.text import slugify
+
+
+def populate_authors(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    Author = apps.get_model('store', 'Author')
+
+    slugs = set()
+    authors = []
+    for row in Book.objects.values('author').annotate(book_count=Count('isbn'), average_rating=Avg('rating')).order_by('author'):
+        base = slugify(row['author']) or 'author'
+        slug = base
+        number = 2
+        while slug in slugs:
+            slug = base + '-' + str(number)
+            number += 1
+        slugs.add(slug)
+        authors.append(Author(
+            name=row['author'],
+            slug=slug,
+            book_count=row['book_count'],
+            average_rating=round(row['average_rating'], 2),
+        ))
+    Author.objects.bulk_create(authors, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_book_author_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Author',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True)),
+                ('slug', models.SlugField(max_length=220, unique=True)),
+                ('book_count', models.IntegerField(default=0)),
+                ('average_rating', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.RunPython(populate_authors, migrations.RunPython.noop),
+    ]
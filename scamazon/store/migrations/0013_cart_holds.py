@@ -0,0 +1,32 @@
+# Generated by Django 4.2.10 on 2026-10-18 14:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_author'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='reserved',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='reserved_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='reserved',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['reserved_until'], name='cart_reserved_until_idx'),
+        ),
+    ]
@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def usernames_to_users(apps, schema_editor):
+    Cart = apps.get_model('store', 'Cart')
+    CustomUser = apps.get_model('store', 'CustomUser')
+
+    users = dict(CustomUser.objects.values_list('username', 'id'))
+    kept = {}
+    for cart in Cart.objects.order_by('id'):
+        user_id = users.get(cart.userID)
+        if user_id is None:
+            #the user is gone, so is their cart
+            cart.delete()
+            continue
+
+        #merge duplicate rows for the same listing before the unique constraint goes on
+        key = (user_id, cart.listingID_id)
+        if key in kept:
+            first = kept[key]
+            first.quantity += cart.quantity
+            first.reserved += cart.reserved
+            first.save()
+            cart.delete()
+            continue
+
+        cart.user = user_id
+        cart.save()
+        kept[key] = cart
+
+def users_to_usernames(apps, schema_editor):
+    Cart = apps.get_model('store', 'Cart')
+    CustomUser = apps.get_model('store', 'CustomUser')
+
+    usernames = dict(CustomUser.objects.values_list('id', 'username'))
+    for cart in Cart.objects.all():
+        cart.userID = usernames.get(cart.user, '')
+        cart.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_cart_holds'),
+    ]
+
+    operations = [
+        #nullable so the migration can be reversed over existing rows
+        migrations.AlterField(
+            model_name='cart',
+            name='userID',
+            field=models.CharField(max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='user',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.RunPython(usernames_to_users, users_to_usernames),
+        migrations.RemoveField(
+            model_name='cart',
+            name='userID',
+        ),
+        migrations.RenameField(
+            model_name='cart',
+            old_name='user',
+            new_name='userID',
+        ),
+        migrations.AlterField(
+            model_name='cart',
+            name='userID',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('userID', 'listingID'), name='cart_user_listing_unique'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.10 on 2026-10-18 15:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_cart_user_foreign_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='returned',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['seller', 'delivered'], name='order_seller_delivered_idx'),
+        ),
+    ]
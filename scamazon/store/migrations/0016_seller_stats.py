@@ -0,0 +1,65 @@
+# Generated by Django 4.2.10 on 2026-10-18 15:06
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, FloatField, Q, Sum
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def populate_seller_stats(apps, schema_editor):
+    Order = apps.get_model('store', 'Order')
+    SellerStats = apps.get_model('store', 'SellerStats')
+    SellerDailyStats = apps.get_model('store', 'SellerDailyStats')
+
+    kept = Q(returned=False)
+    totals = dict(
+        revenue=Coalesce(Sum(F('quantity') * F('price'), filter=kept, output_field=FloatField()), 0.0),
+        units=Coalesce(Sum('quantity', filter=kept), 0),
+        returns=Count('id', filter=Q(returned=True)),
+    )
+    orders = Order.objects.filter(seller__isnull=False)
+    SellerStats.objects.bulk_create([
+        SellerStats(seller_id=row.pop('seller'), **row)
+        for row in orders.values('seller').annotate(undelivered=Count('id', filter=kept & Q(delivered=False)), **totals).order_by('seller')
+    ], batch_size=1000)
+    SellerDailyStats.objects.bulk_create([
+        SellerDailyStats(seller_id=row.pop('seller'), **row)
+        for row in orders.values('seller', 'date').annotate(**totals).order_by('seller', 'date')
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_order_returned_seller_delivered_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SellerStats',
+            fields=[
+                ('seller', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('revenue', models.FloatField(default=0)),
+                ('units', models.IntegerField(default=0)),
+                ('undelivered', models.IntegerField(default=0)),
+                ('returns', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SellerDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('revenue', models.FloatField(default=0)),
+                ('units', models.IntegerField(default=0)),
+                ('returns', models.IntegerField(default=0)),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='sellerdailystats',
+            constraint=models.UniqueConstraint(fields=('seller', 'date'), name='seller_daily_stats_unique'),
+        ),
+        migrations.RunPython(populate_seller_stats, migrations.RunPython.noop),
+    ]
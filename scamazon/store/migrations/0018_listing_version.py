@@ -0,0 +1,19 @@
+# Generated by Django 4.2.10 on 2026-10-18 15:23
+
+from django.db import migrations, models
+import store.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_order_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='version',
+            field=models.BigIntegerField(default=store.models.first_listing_version),
+        ),
+    ]
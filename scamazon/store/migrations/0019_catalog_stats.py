@@ -0,0 +1,33 @@
+# Generated by Django 4.2.10 on 2026-10-18 15:25
+
+from django.db import migrations, models
+
+
+def populate_catalog_stats(apps, schema_editor):
+    CatalogStats = apps.get_model('store', 'CatalogStats')
+    CatalogStats.objects.create(
+        id=1,
+        books=apps.get_model('store', 'Book').objects.count(),
+        listings=apps.get_model('store', 'Listing').objects.count(),
+        sellers=apps.get_model('store', 'CustomUser').objects.filter(type='Seller').count(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_listing_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('books', models.IntegerField(default=0)),
+                ('listings', models.IntegerField(default=0)),
+                ('sellers', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(populate_catalog_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,130 @@
+import re
+
+from django.core.cache import cache
+from django.db import migrations
+from django.db.models import Avg, Count
+from django.utils.text import slugify
+
+
+#copies of store/isbn.py and the search index SQL as they were when this was written,
+#so later changes to those modules can't change what this migration does
+
+SEPARATORS_RE = re.compile(r'[\s\-\u2010-\u2015.]')
+ISBN10_RE = re.compile(r'^[0-9]{9}[0-9X]$')
+ISBN13_RE = re.compile(r'^97[89][0-9]{10}$')
+
+
+def isbn10_check_digit(digits):
+    check = (11 - sum((10 - i) * int(d) for i, d in enumerate(digits[:9])) % 11) % 11
+    return 'X' if check == 10 else str(check)
+
+def isbn13_check_digit(digits):
+    return str((10 - sum((3 if i % 2 else 1) * int(d) for i, d in enumerate(digits[:12])) % 10) % 10)
+
+def isbn_key(value):
+    #the 13 digit form of a valid ISBN-10 or ISBN-13, anything else just without separators
+    value = SEPARATORS_RE.sub('', str(value)).upper()
+    if ISBN13_RE.match(value) and isbn13_check_digit(value) == value[-1]:
+        return value
+    if ISBN10_RE.match(value) and isbn10_check_digit(value) == value[-1]:
+        digits = '978' + value[:9]
+        return digits + isbn13_check_digit(digits)
+    return value
+
+
+def index_book(cursor, vendor, book):
+    row = [str(book.isbn), book.title, book.author, book.description or '']
+    if vendor == 'sqlite':
+        cursor.execute("DELETE FROM store_book_fts WHERE isbn = %s", row[:1])
+        cursor.execute("INSERT INTO store_book_fts (isbn, title, author, description) VALUES (%s, %s, %s, %s)", row)
+    elif vendor == 'postgresql':
+        cursor.execute(
+            "INSERT INTO store_book_search (isbn, document) VALUES (%s, "
+            "setweight(to_tsvector('english', %s), 'A') || "
+            "setweight(to_tsvector('english', %s), 'B') || "
+            "setweight(to_tsvector('english', %s), 'C')) "
+            "ON CONFLICT (isbn) DO UPDATE SET document = EXCLUDED.document",
+            row,
+        )
+
+def unindex_book(cursor, vendor, isbn):
+    if vendor == 'sqlite':
+        cursor.execute("DELETE FROM store_book_fts WHERE isbn = %s", [str(isbn)])
+    elif vendor == 'postgresql':
+        cursor.execute("DELETE FROM store_book_search WHERE isbn = %s", [str(isbn)])
+
+
+def normalize_isbns(apps, schema_editor):
+    '''
+    Moves books stored under a valid ISBN in another form (ISBN-10, dashes) to
+    the 13 digit key that lookups now use. The isbn is the primary key, so each
+    one is copied to the new key, its listings and orders repointed, and the
+    old row deleted; a book already stored under the new key just absorbs them.
+    '''
+    db = schema_editor.connection.alias
+    vendor = schema_editor.connection.vendor
+    Book = apps.get_model('store', 'Book')
+    Listing = apps.get_model('store', 'Listing')
+    Order = apps.get_model('store', 'Order')
+    CatalogStats = apps.get_model('store', 'CatalogStats')
+    Author = apps.get_model('store', 'Author')
+
+    moves = {}
+    for isbn in Book.objects.using(db).values_list('isbn', flat=True).iterator():
+        key = isbn_key(isbn)
+        if key != isbn:
+            moves[isbn] = key
+
+    merged_authors = set()
+    with schema_editor.connection.cursor() as cursor:
+        for old, new in moves.items():
+            book = Book.objects.using(db).get(isbn=old)
+            if not Book.objects.using(db).filter(isbn=new).exists():
+                book.isbn = new
+                book.save(using=db, force_insert=True)
+                index_book(cursor, vendor, book)
+            else:
+                merged_authors.add(book.author)
+            Listing.objects.using(db).filter(isbn_id=old).update(isbn_id=new)
+            Order.objects.using(db).filter(book_id=old).update(book_id=new)
+            Book.objects.using(db).filter(isbn=old).delete()
+            unindex_book(cursor, vendor, old)
+
+    if moves:
+        #merged duplicates drop the book count, and the signals that keep it don't run here
+        CatalogStats.objects.using(db).filter(id=1).update(books=Book.objects.using(db).count())
+        #same for the Author rows of the merged books (see Author.refresh)
+        for name in merged_authors:
+            refresh_author(Author, Book, db, name)
+        #and every cached page built before the move; the cache only holds data worked out from the tables
+        cache.clear()
+
+
+def refresh_author(Author, Book, db, name):
+    stats = Book.objects.using(db).filter(author=name).aggregate(book_count=Count('isbn'), average_rating=Avg('rating'))
+    if stats['book_count'] == 0:
+        Author.objects.using(db).filter(name=name).delete()
+        return
+    author = Author.objects.using(db).filter(name=name).first()
+    if author is None:
+        base = slugify(name) or 'author'
+        slug = base
+        number = 2
+        while Author.objects.using(db).filter(slug=slug).exists():
+            slug = base + '-' + str(number)
+            number += 1
+        author = Author(name=name, slug=slug)
+    author.book_count = stats['book_count']
+    author.average_rating = round(stats['average_rating'], 2)
+    author.save(using=db)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0022_image_sha256'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_isbns, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.10 on 2026-10-18 16:18
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def first_letter(name):
+    #a copy of Author.first_letter as it was when this was written
+    for char in unicodedata.normalize('NFKD', name):
+        if char.isalnum():
+            char = char.upper()
+            return char if 'A' <= char <= 'Z' else '#'
+    return '#'
+
+def populate_letters(apps, schema_editor):
+    Author = apps.get_model('store', 'Author')
+    authors = list(Author.objects.using(schema_editor.connection.alias).only('id', 'name'))
+    for author in authors:
+        author.letter = first_letter(author.name)
+    Author.objects.using(schema_editor.connection.alias).bulk_update(authors, ['letter'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0023_normalize_isbns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='author',
+            name='letter',
+            field=models.CharField(default='#', max_length=1),
+        ),
+        migrations.RunPython(populate_letters, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['letter', 'name'], name='author_letter_name_idx'),
+        ),
+    ]
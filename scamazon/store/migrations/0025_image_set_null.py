@@ -0,0 +1,24 @@
+# Generated by Django 4.2.10 on 2026-10-18 16:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0024_author_letter'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='listing',
+            name='image',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='store.image'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='oldListingImage',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='store.image'),
+        ),
+    ]
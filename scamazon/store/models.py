@@ -1,6 +1,14 @@
-from django.db import models
+import hashlib
+import os
+import time
+import unicodedata
+
+from django.db import models, transaction, IntegrityError
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db.models import Avg, Count, F
+from django.utils import timezone
+from django.utils.text import slugify
 
 class CustomUser(AbstractUser):
     type = models.CharField(max_length=10)
@@ -13,6 +21,13 @@ class Book(models.Model):
     rating = models.FloatField(default=0, validators = [MinValueValidator(0), MaxValueValidator(5.0)])
     description = models.CharField(default = None, blank = True, null = True, max_length = 1500)
 
+    class Meta:
+        indexes = [
+            #browse_books seeks on (title, isbn)
+            models.Index(fields = ['title', 'isbn'], name = 'book_title_isbn_idx'),
+            #browse_authors groups and seeks on author
+            models.Index(fields = ['author'], name = 'book_author_idx'),
+        ]
 
     def __str__(self):
         return self.title + " by " + self.author
@@ -21,9 +36,112 @@ class Book(models.Model):
         return self.rating >= 4
 
 
+class Author(models.Model):
+    #summary of Book.author kept up to date by signals (see signals.py) and rebuild_authors
+    name = models.CharField(max_length=200, unique=True)
+    slug = models.SlugField(max_length=220, unique=True)
+    book_count = models.IntegerField(default=0)
+    average_rating = models.FloatField(default=0)
+    #the A-Z bucket on the browse page ('#' for anything else), stored so it doesn't depend on the database's collation
+    letter = models.CharField(max_length=1, default='#')
+
+    class Meta:
+        indexes = [models.Index(fields=['letter', 'name'], name='author_letter_name_idx')]
+
+    def __str__(self):
+        return self.name
+
+    def save(self, *args, **kwargs):
+        self.letter = Author.first_letter(self.name)
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def first_letter(name):
+        #first letter or digit, accents dropped: "O'Brien" -> O, "Émile" -> E, "50 Cent" -> #
+        for char in unicodedata.normalize('NFKD', name):
+            if char.isalnum():
+                char = char.upper()
+                return char if 'A' <= char <= 'Z' else '#'
+        return '#'
+
+    @staticmethod
+    def unique_slug(name, taken=None):
+        #taken(slug) says if a slug is in use; by default the database is asked
+        if taken is None:
+            taken = lambda slug: Author.objects.filter(slug=slug).exists()
+        base = slugify(name) or 'author'
+        slug = base
+        number = 2
+        while taken(slug):
+            slug = base + '-' + str(number)
+            number += 1
+        return slug
+
+    @classmethod
+    def refresh(cls, name):
+        #recount one author from their books (uses the Book.author index)
+        stats = Book.objects.filter(author=name).aggregate(book_count=Count('isbn'), average_rating=Avg('rating'))
+        if stats['book_count'] == 0:
+            cls.objects.filter(name=name).delete()
+            return None
+        author = cls.objects.filter(name=name).first()
+        if author is None:
+            author = cls(name=name, slug=cls.unique_slug(name))
+        author.book_count = stats['book_count']
+        author.average_rating = round(stats['average_rating'], 2)
+        author.save()
+        return author
+
+
 class Image(models.Model):
     image = models.ImageField(upload_to = '')
+    #hash of the uploaded bytes; identical uploads share one row and file (see from_upload)
+    sha256 = models.CharField(max_length = 64, unique = True, null = True, blank = True)
+    #resized copies made by thumbnails.py: {format: [[width, height, file name], ...]} smallest first
+    variants = models.JSONField(default = dict, blank = True)
+    #True until the background job has made the thumbnails; pages show a placeholder meanwhile
+    pending = models.BooleanField(default = True)
+
+    @staticmethod
+    def file_sha256(file):
+        #file is a django File (an upload or a FieldFile), chunks() reads it from the start
+        digest = hashlib.sha256()
+        for chunk in file.chunks():
+            digest.update(chunk)
+        return digest.hexdigest()
+
+    @classmethod
+    def from_upload(cls, upload):
+        '''
+        The Image for an uploaded file: the existing one if the same bytes were
+        uploaded before, otherwise a new one saved under its hash, so the file
+        name (and URL) only ever points at that content.
+        '''
+        sha256 = cls.file_sha256(upload)
+        image = cls.objects.filter(sha256 = sha256).first()
+        if image is not None:
+            return image
+        extension = os.path.splitext(upload.name)[1].lower()
+        upload.name = sha256 + extension
+        try:
+            with transaction.atomic():
+                return cls.objects.create(image = upload, sha256 = sha256)
+        except IntegrityError:
+            #someone uploaded the same file at the same moment
+            return cls.objects.get(sha256 = sha256)
+
+    def srcset(self, format):
+        return ', '.join('%s %dw' % (self.image.storage.url(name), width) for width, height, name in self.variants.get(format, []))
+
+    def smallest(self, format):
+        variants = self.variants.get(format)
+        return variants[0] if variants else None
+
 
+def first_listing_version():
+    #starts from the clock, not 0, so a listing recreated with an old id (see fulfillment.py)
+    #never reuses a version, and so a cached card, of the listing it replaces
+    return time.time_ns() // 1000
 
 class Listing(models.Model):
     listingID = models.CharField(max_length = 13)
@@ -31,28 +149,126 @@ class Listing(models.Model):
     quantity = models.IntegerField(default = 1)
     userID = models.ForeignKey(CustomUser, null = True, on_delete=models.DO_NOTHING)
     price = models.FloatField(default = 0, validators = [MinValueValidator(0)])
-    image = models.ForeignKey(Image, null = True, on_delete=models.CASCADE)
+    #deleting an image leaves the listing without a picture rather than deleting it
+    image = models.ForeignKey(Image, null = True, on_delete=models.SET_NULL)
+    #copies currently held by carts (see reservations.py)
+    reserved = models.IntegerField(default = 0)
+    #bumped on every change (save or the stock UPDATEs) so the cached card in book.html is rebuilt
+    version = models.BigIntegerField(default = first_listing_version)
+
+    def available(self):
+        return self.quantity - self.reserved
+
+    def save(self, *args, **kwargs):
+        bump = not self._state.adding
+        if bump:
+            #in the database, not on our copy: a hold taken since this row was read has bumped it already
+            self.version = F('version') + 1
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'version'}
+        super().save(*args, **kwargs)
+        if bump:
+            self.refresh_from_db(fields=['version'])
 
 class Cart(models.Model):
     listingID = models.ForeignKey(Listing, null = True, on_delete=models.CASCADE)
     quantity = models.IntegerField(default=1)
-    userID = models.CharField(max_length=20)
+    userID = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    #how many of quantity are held on the listing, and until when
+    reserved = models.IntegerField(default=0)
+    reserved_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            #release_expired_holds looks for old holds
+            models.Index(fields = ['reserved_until'], name = 'cart_reserved_until_idx'),
+        ]
+        constraints = [
+            #one row per listing in a cart, its index also serves every "this user's cart" lookup
+            models.UniqueConstraint(fields = ['userID', 'listingID'], name = 'cart_user_listing_unique'),
+        ]
 
 class Order(models.Model):
     date = models.DateField()
     oldListingId = models.IntegerField(default=0)
-    oldListingImage = models.ForeignKey(Image, null = True, on_delete=models.CASCADE)
+    #orders are records of a sale, they outlive the picture
+    oldListingImage = models.ForeignKey(Image, null = True, on_delete=models.SET_NULL)
     quantity = models.IntegerField(default=1)
     book = models.ForeignKey(Book, null = True, on_delete=models.CASCADE)
     price = models.FloatField(default = 0, validators = [MinValueValidator(0)])
     buyer = models.ForeignKey(CustomUser, null = True, on_delete=models.DO_NOTHING, related_name='buyer')
     seller = models.ForeignKey(CustomUser, null = True, on_delete=models.DO_NOTHING, related_name='seller')
     delivered = models.BooleanField(default=False)
+    #returned orders are kept (not deleted) so sellers can see their returns
+    returned = models.BooleanField(default=False)
     address = models.CharField(max_length=200)
     payment = models.CharField(max_length=200)
 
+    class Meta:
+        indexes = [
+            #seller dashboard counters (see stats.py)
+            models.Index(fields = ['seller', 'delivered'], name = 'order_seller_delivered_idx'),
+            #order history pages, newest first (see views.order_page)
+            models.Index(fields = ['seller', 'date'], name = 'order_seller_date_idx'),
+            models.Index(fields = ['buyer', 'date'], name = 'order_buyer_date_idx'),
+        ]
+
     def get_payment_last_4_digits(self):
         return self.payment[-4:]
     
     def get_total_payment(self):
         return round(self.quantity * self.price, 2)
+
+
+class SellerStats(models.Model):
+    #running totals per seller, kept by stats.py and reconciled by rebuild_seller_stats
+    seller = models.OneToOneField(CustomUser, primary_key=True, on_delete=models.CASCADE, related_name='stats')
+    revenue = models.FloatField(default=0)
+    units = models.IntegerField(default=0)
+    undelivered = models.IntegerField(default=0)
+    returns = models.IntegerField(default=0)
+
+class SellerDailyStats(models.Model):
+    #the same totals bucketed by the date the orders were placed
+    seller = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    revenue = models.FloatField(default=0)
+    units = models.IntegerField(default=0)
+    returns = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields = ['seller', 'date'], name = 'seller_daily_stats_unique'),
+        ]
+
+
+class CatalogStats(models.Model):
+    #single row (pk 1) of site wide counts, kept by signals and rebuild_catalog_stats (see stats.py)
+    books = models.IntegerField(default=0)
+    listings = models.IntegerField(default=0)
+    sellers = models.IntegerField(default=0)
+
+
+class Job(models.Model):
+    #background work queue run by the run_jobs command (see jobs.py)
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (FAILED, 'Failed')]
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    #not picked up before this, pushed back after each failed attempt
+    run_after = models.DateTimeField(default=timezone.now)
+    #a running job whose worker died is picked up again after this
+    locked_until = models.DateTimeField(null=True, blank=True)
+    claimed_by = models.CharField(max_length=64, blank=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields = ['status', 'run_after'], name = 'job_status_run_after_idx'),
+        ]
@@ -0,0 +1,159 @@
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+'''
+Keyset (seek) pagination helpers.
+
+Instead of OFFSET, each page remembers the sort key of its first and last rows
+and the next query asks for rows strictly after/before that key. With an index
+on the ordering columns every page costs the same as page 1.
+'''
+
+class KeysetPage:
+    def __init__(self, items, size, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.size = size
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), cls=DjangoJSONEncoder).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor, length):
+    #returns None for anything that isn't a cursor we made so the caller can start over
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != length:
+        return None
+    return values
+
+def _clean_value(queryset, name, value):
+    #the value as the column's own type, so a tampered cursor fails here and not in the query
+    if isinstance(value, bool) or not isinstance(value, (str, int, float, type(None))):
+        raise ValueError(value)
+    try:
+        field = queryset.model._meta.get_field(name)
+    except FieldDoesNotExist:
+        #an annotation, like values(author=F('name'))
+        annotation = queryset.query.annotations.get(name)
+        if annotation is None:
+            return value
+        field = annotation.output_field
+    if value is None and not field.null:
+        raise ValueError(value)
+    value = field.to_python(value)
+    #range and length limits; sqlite declares no integer range, so also keep to 64 bits
+    field.run_validators(value)
+    if isinstance(value, int) and not -2 ** 63 <= value < 2 ** 63:
+        raise ValueError(value)
+    return value
+
+def clean_cursor(queryset, ordering, cursor):
+    '''
+    The sort key in cursor, each value converted to its field's type, or None
+    if cursor is missing, isn't one of ours or doesn't fit these fields.
+    '''
+    values = decode_cursor(cursor, len(ordering)) if cursor else None
+    if values is None:
+        return None
+    try:
+        return [_clean_value(queryset, field.lstrip('-'), value) for field, value in zip(ordering, values)]
+    except (ValidationError, ValueError, TypeError):
+        return None
+
+def get_page_size(request):
+    try:
+        size = int(request.GET.get('size', settings.PAGE_SIZE))
+    except ValueError:
+        size = settings.PAGE_SIZE
+    return max(1, min(size, settings.MAX_PAGE_SIZE))
+
+
+def _field_value(item, field):
+    if isinstance(item, dict):
+        return item[field]
+    return getattr(item, field)
+
+def _row_key(item, fields):
+    return [_field_value(item, field.lstrip('-')) for field in fields]
+
+def _seek_filter(fields, values, forward):
+    # (a, b) > (x, y)  ==  a > x OR (a = x AND b > y)
+    query = Q()
+    equal = {}
+    for field, value in zip(fields, values):
+        name = field.lstrip('-')
+        descending = field.startswith('-')
+        lookup = 'lt' if descending == forward else 'gt'
+        query |= Q(**equal, **{name + '__' + lookup: value})
+        equal[name] = value
+    return query
+
+def _reverse_ordering(fields):
+    return [field[1:] if field.startswith('-') else '-' + field for field in fields]
+
+
+def keyset_paginate(queryset, ordering, size, after=None, before=None):
+    '''
+    Returns one KeysetPage of queryset sorted by ordering (a list of field names,
+    '-' for descending). The last field must be unique so the key is total.
+    after/before are cursors taken from a previous page.
+    '''
+    ordering = list(ordering)
+    #a cursor that can't be used (edited, or from another page) just starts over at page 1
+    after_key = clean_cursor(queryset, ordering, after)
+    before_key = clean_cursor(queryset, ordering, before)
+
+    if before_key is not None:
+        rows = queryset.filter(_seek_filter(ordering, before_key, forward=False))
+        rows = list(rows.order_by(*_reverse_ordering(ordering))[:size + 1])
+        more = len(rows) > size
+        items = rows[:size][::-1]
+        if not items:
+            return KeysetPage(items, size)
+        return KeysetPage(
+            items,
+            size,
+            next_cursor=encode_cursor(_row_key(items[-1], ordering)),
+            prev_cursor=encode_cursor(_row_key(items[0], ordering)) if more else None,
+        )
+
+    if after_key is not None:
+        queryset = queryset.filter(_seek_filter(ordering, after_key, forward=True))
+    rows = list(queryset.order_by(*ordering)[:size + 1])
+    more = len(rows) > size
+    items = rows[:size]
+    if not items:
+        return KeysetPage(items, size)
+    return KeysetPage(
+        items,
+        size,
+        next_cursor=encode_cursor(_row_key(items[-1], ordering)) if more else None,
+        prev_cursor=encode_cursor(_row_key(items[0], ordering)) if after_key is not None else None,
+    )
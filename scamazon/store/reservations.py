@@ -0,0 +1,146 @@
+import datetime
+
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.db.models import Case, F, OuterRef, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Cart, Listing
+from . import caching
+
+
+'''
+Stock holds for carts.
+
+Putting copies in a cart holds them on the listing (Listing.reserved) for
+CART_HOLD_MINUTES, so the copies a buyer sees as available are
+quantity - reserved and nobody can cart more than that. Each Cart row records
+how many copies it holds and until when; release_expired() (run by the
+release_expired_holds command) gives back holds that ran out, and
+repair_reserved() (run after it) puts right any listing whose count no longer
+matches its carts.
+'''
+
+def hold_expiry():
+    return timezone.now() + datetime.timedelta(minutes=settings.CART_HOLD_MINUTES)
+
+
+def reserve(listing_id, amount):
+    #one conditional UPDATE: only succeeds if that many copies are still free
+    def take():
+        taken = Listing.objects.filter(id=listing_id, quantity__gte=F('reserved') + amount).update(reserved=F('reserved') + amount, version=F('version') + 1)
+        if taken:
+            caching.touch_listings([listing_id])
+        return taken
+
+    if amount <= 0:
+        return True
+    if take():
+        return True
+    #maybe the copies are only held by carts that expired, free those and try again
+    if release_expired(listing_id=listing_id):
+        return take() > 0
+    return False
+
+def unreserve(listing_id, amount):
+    if amount > 0:
+        Listing.objects.filter(id=listing_id).update(reserved=F('reserved') - amount, version=F('version') + 1)
+        caching.touch_listings([listing_id])
+
+
+def add_to_cart(user, listing_id):
+    '''Adds one copy of the listing to the user's cart, returns False if there isn't a free copy.'''
+    if Cart.objects.filter(userID=user, listingID=listing_id).exists():
+        return True
+    try:
+        with transaction.atomic():
+            if not reserve(listing_id, 1):
+                return False
+            Cart.objects.create(listingID_id=listing_id, quantity=1, userID=user, reserved=1, reserved_until=hold_expiry())
+    except IntegrityError:
+        #a double click already added it, the rollback gave our hold back
+        pass
+    return True
+
+def _update_cart_item(item, target):
+    #the row is locked and read again inside the transaction, so a double click or the
+    #sweeper running at the same moment can't make us give back or take a hold twice
+    with transaction.atomic():
+        item = Cart.objects.select_for_update().filter(id=item.id).first()
+        if item is None:
+            #already removed by another request
+            return False
+        quantity = target(item)
+        if quantity <= 0:
+            unreserve(item.listingID_id, item.reserved)
+            item.delete()
+            return True
+        if quantity > item.reserved:
+            if not reserve(item.listingID_id, quantity - item.reserved):
+                return False
+        else:
+            unreserve(item.listingID_id, item.reserved - quantity)
+        item.quantity = quantity
+        item.reserved = quantity
+        item.reserved_until = hold_expiry()
+        item.save(update_fields=['quantity', 'reserved', 'reserved_until'])
+    return True
+
+def set_cart_quantity(item, quantity):
+    '''
+    Changes how many copies a cart row wants (0 removes it) and holds exactly
+    that many. Returns False, leaving the row alone, if there aren't enough free copies.
+    '''
+    return _update_cart_item(item, lambda current: quantity)
+
+def change_cart_quantity(item, step):
+    '''Like set_cart_quantity, but step (+1 or -1) is applied to the row as it is now.'''
+    return _update_cart_item(item, lambda current: current.quantity + step)
+
+def remove_from_cart(item):
+    set_cart_quantity(item, 0)
+
+
+def release_expired(listing_id=None, now=None, batch_size=1000):
+    '''Gives back every hold that has run out; returns how many copies were released.'''
+    now = now or timezone.now()
+    released = 0
+    while True:
+        with transaction.atomic():
+            expired = Cart.objects.select_for_update().filter(reserved__gt=0, reserved_until__lt=now)
+            if listing_id is not None:
+                expired = expired.filter(listingID=listing_id)
+            expired = list(expired.values_list('id', 'listingID_id', 'reserved')[:batch_size])
+            if not expired:
+                return released
+
+            by_listing = {}
+            for _, expired_listing, reserved in expired:
+                by_listing[expired_listing] = by_listing.get(expired_listing, 0) + reserved
+            Listing.objects.filter(id__in=list(by_listing)).update(reserved=Case(
+                *[When(id=expired_listing, then=F('reserved') - amount) for expired_listing, amount in by_listing.items()],
+                default=F('reserved'),
+            ), version=F('version') + 1)
+            Cart.objects.filter(id__in=[cart_id for cart_id, _, _ in expired]).update(reserved=0, reserved_until=None)
+            caching.touch_listings(by_listing)
+            released += sum(by_listing.values())
+
+
+def repair_reserved():
+    '''
+    Sets Listing.reserved back to what the carts actually hold, for listings
+    where the two have drifted apart; returns how many listings were fixed.
+    Every change to a cart's hold also changes the listing's count, so this
+    only finds something after a crash or a bug, never in normal use.
+    '''
+    #expired holds the sweeper hasn't got to yet still count: it takes them off the listing when it does
+    held = Coalesce(Subquery(
+        Cart.objects.filter(listingID=OuterRef('pk')).values('listingID').annotate(total=Sum('reserved')).values('total')
+    ), 0)
+    with transaction.atomic():
+        drifted = list(Listing.objects.select_for_update().annotate(held=held).exclude(reserved=F('held')).values_list('id', flat=True))
+        if drifted:
+            Listing.objects.filter(id__in=drifted).update(reserved=held, version=F('version') + 1)
+            caching.touch_listings(drifted)
+    return len(drifted)
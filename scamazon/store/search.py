@@ -0,0 +1,177 @@
+import re
+
+from django.db import connection
+
+from .models import Book
+from .isbn import looks_like_isbn, normalize_isbn
+
+
+'''
+Full-text search over Book title/author/description.
+
+The index lives in a side table that the migrations create for the database
+in use and that signals.py keeps in sync on every Book save/delete:
+    sqlite   -> store_book_fts, an FTS5 virtual table ranked with bm25
+    postgres -> store_book_search, a tsvector column with a GIN index ranked with ts_rank
+Any other database falls back to the old (slow) substring search.
+'''
+
+SQLITE_TABLE = 'store_book_fts'
+POSTGRES_TABLE = 'store_book_search'
+
+#title matches count more than author matches, which count more than the description
+SQLITE_WEIGHTS = (10.0, 5.0, 1.0)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _tokens(text):
+    return TOKEN_RE.findall(text or '')
+
+def _sqlite_query(text):
+    #every word is quoted (so user input can't use FTS syntax) and prefix matched
+    return ' '.join('"%s"*' % token for token in _tokens(text))
+
+def _postgres_query(text):
+    return ' & '.join('%s:*' % token for token in _tokens(text))
+
+
+def create_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS " + SQLITE_TABLE + " USING fts5("
+            "isbn UNINDEXED, title, author, description, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE TABLE IF NOT EXISTS " + POSTGRES_TABLE + " ("
+            "isbn varchar(13) PRIMARY KEY REFERENCES store_book(isbn) ON DELETE CASCADE, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS store_book_search_document_idx ON "
+            + POSTGRES_TABLE + " USING gin(document)"
+        )
+
+def drop_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS " + SQLITE_TABLE)
+    elif vendor == 'postgresql':
+        schema_editor.execute("DROP TABLE IF EXISTS " + POSTGRES_TABLE)
+
+
+def _write_rows(cursor, rows):
+    if connection.vendor == 'sqlite':
+        cursor.executemany(
+            "DELETE FROM " + SQLITE_TABLE + " WHERE isbn = %s",
+            [(isbn,) for isbn, _, _, _ in rows],
+        )
+        cursor.executemany(
+            "INSERT INTO " + SQLITE_TABLE + " (isbn, title, author, description) VALUES (%s, %s, %s, %s)",
+            rows,
+        )
+    elif connection.vendor == 'postgresql':
+        cursor.executemany(
+            "INSERT INTO " + POSTGRES_TABLE + " (isbn, document) VALUES (%s, "
+            "setweight(to_tsvector('english', %s), 'A') || "
+            "setweight(to_tsvector('english', %s), 'B') || "
+            "setweight(to_tsvector('english', %s), 'C')) "
+            "ON CONFLICT (isbn) DO UPDATE SET document = EXCLUDED.document",
+            rows,
+        )
+
+def index_books(books):
+    rows = [(str(book.isbn), book.title, book.author, book.description or '') for book in books]
+    if rows:
+        with connection.cursor() as cursor:
+            _write_rows(cursor, rows)
+
+def index_book(book):
+    index_books([book])
+
+def unindex_book(isbn):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute("DELETE FROM " + SQLITE_TABLE + " WHERE isbn = %s", [str(isbn)])
+        elif connection.vendor == 'postgresql':
+            cursor.execute("DELETE FROM " + POSTGRES_TABLE + " WHERE isbn = %s", [str(isbn)])
+
+def rebuild_index(batch_size=2000):
+    #wipe and re-add every book, used after bulk imports that skip the signals
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute("DELETE FROM " + SQLITE_TABLE)
+        elif connection.vendor == 'postgresql':
+            cursor.execute("DELETE FROM " + POSTGRES_TABLE)
+        else:
+            return 0
+
+    count = 0
+    batch = []
+    for book in Book.objects.only('isbn', 'title', 'author', 'description').iterator(chunk_size=batch_size):
+        batch.append(book)
+        if len(batch) == batch_size:
+            index_books(batch)
+            count += len(batch)
+            batch = []
+    index_books(batch)
+    return count + len(batch)
+
+
+def _ranked_isbns(text, limit, offset):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            query = _sqlite_query(text)
+            if not query:
+                return []
+            cursor.execute(
+                "SELECT isbn FROM " + SQLITE_TABLE + " WHERE " + SQLITE_TABLE + " MATCH %s "
+                "ORDER BY bm25(" + SQLITE_TABLE + ", %s, %s, %s), isbn LIMIT %s OFFSET %s",
+                [query, *SQLITE_WEIGHTS, limit, offset],
+            )
+        else:
+            query = _postgres_query(text)
+            if not query:
+                return []
+            cursor.execute(
+                "SELECT isbn FROM " + POSTGRES_TABLE + ", to_tsquery('english', %s) query "
+                "WHERE document @@ query ORDER BY ts_rank(document, query) DESC, isbn LIMIT %s OFFSET %s",
+                [query, limit, offset],
+            )
+        return [str(row[0]) for row in cursor.fetchall()]
+
+def _fallback_isbns(text, limit, offset):
+    results = Book.objects.filter(title__contains=text)
+    results = results | Book.objects.filter(author__contains=text)
+    results = results.order_by("title", "author", "rating")
+    return list(results.values_list('isbn', flat=True)[offset:offset + limit])
+
+
+def search_books(text, limit, offset=0):
+    '''
+    Returns (books, more): up to limit Books matching text best match first, and
+    whether there is another page. A search that is a valid ISBN (any form) finds
+    just that book; one that is exactly some other book key also puts that
+    book at the top of the first page.
+    '''
+    text = text.strip()
+    if looks_like_isbn(text):
+        #however it was typed, an ISBN is one primary key lookup and nothing else would match it
+        book = Book.objects.filter(isbn=normalize_isbn(text)).first() if offset == 0 else None
+        return ([book] if book else []), False
+
+    if connection.vendor in ('sqlite', 'postgresql'):
+        isbns = _ranked_isbns(text, limit + 1, offset)
+    else:
+        isbns = _fallback_isbns(text, limit + 1, offset)
+    more = len(isbns) > limit
+    isbns = isbns[:limit]
+
+    if offset == 0 and text not in isbns and Book.objects.filter(isbn=text).exists():
+        isbns.insert(0, text)
+
+    books = Book.objects.in_bulk(isbns)
+    return [books[isbn] for isbn in isbns if isbn in books], more
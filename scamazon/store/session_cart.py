@@ -0,0 +1,89 @@
+import json
+
+from django.conf import settings
+from django.contrib import messages
+
+from .models import Cart, Listing
+from .reservations import add_to_cart, set_cart_quantity
+
+
+'''
+Cart for visitors who aren't logged in.
+
+It lives in a signed cookie ({listing id: quantity}) so browsing and clicking
+around the cart never writes to the Cart table. The first request made after
+logging in merges it into the user's database cart, which is when the copies
+get held (see reservations.py), and deletes the cookie.
+'''
+
+COOKIE_NAME = 'cart'
+COOKIE_SALT = 'store.session_cart'
+
+
+def read(request):
+    try:
+        raw = request.get_signed_cookie(COOKIE_NAME, default=None, salt=COOKIE_SALT)
+        cart = json.loads(raw) if raw else {}
+    except ValueError:
+        return {}
+    if not isinstance(cart, dict):
+        return {}
+    return {str(key): value for key, value in cart.items() if isinstance(value, int) and value > 0}
+
+def write(response, cart):
+    if cart:
+        response.set_signed_cookie(
+            COOKIE_NAME,
+            json.dumps(cart),
+            salt=COOKIE_SALT,
+            max_age=settings.CART_COOKIE_AGE,
+            httponly=True,
+            secure=settings.SESSION_COOKIE_SECURE,
+            samesite='Lax',
+        )
+    else:
+        response.delete_cookie(COOKIE_NAME)
+    return response
+
+
+class SessionCartItem:
+    '''Quacks like a Cart row so cart_display.html can show cookie carts too.'''
+
+    def __init__(self, listing, quantity):
+        self.listingID = listing
+        self.quantity = quantity
+        self.line_total = quantity * listing.price
+
+def items(cart):
+    #one query for every listing in the cookie, listings that are gone just drop out
+    listings = Listing.objects.select_related('isbn', 'image').in_bulk([int(key) for key in cart])
+    return [SessionCartItem(listings[int(key)], quantity) for key, quantity in cart.items() if int(key) in listings]
+
+
+def merge(request, cart):
+    '''Moves a cookie cart into the logged in user's database cart, holding the copies.'''
+    for key, quantity in cart.items():
+        listing_id = int(key)
+        item = Cart.objects.filter(userID=request.user, listingID=listing_id).first()
+        if item is None:
+            if not add_to_cart(request.user, listing_id):
+                messages.warning(request, "Listing %d from your cart is no longer available" % listing_id)
+                continue
+            item = Cart.objects.get(userID=request.user, listingID=listing_id)
+        if quantity > item.quantity and not set_cart_quantity(item, quantity):
+            messages.warning(request, "Not enough copies of listing %d left, your cart has %d" % (listing_id, item.quantity))
+
+
+class SessionCartMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        #request.user is checked after the view so the login request itself does the merge
+        if COOKIE_NAME in request.COOKIES and request.user.is_authenticated:
+            cart = read(request)
+            if cart:
+                merge(request, cart)
+            response.delete_cookie(COOKIE_NAME)
+        return response
@@ -0,0 +1,108 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from django.db import transaction
+from django.db.models import F
+
+from .models import Book, Author, Listing, CustomUser, Image
+from .stats import record_catalog_change
+from . import search, autocomplete, caching, jobs, thumbnails
+
+
+#keep the full-text search index and the typeahead in step with the Book table
+@receiver(post_save, sender=Book)
+def index_saved_book(sender, instance, **kwargs):
+    search.index_book(instance)
+    #the typeahead is process memory, so only touch it once the write is permanent
+    transaction.on_commit(lambda: autocomplete.index.update_book(instance))
+
+@receiver(post_delete, sender=Book)
+def unindex_deleted_book(sender, instance, **kwargs):
+    isbn = instance.isbn
+    search.unindex_book(isbn)
+    transaction.on_commit(lambda: autocomplete.index.remove_book(isbn))
+
+
+#keep the Author summary rows in step with the books they count
+@receiver(pre_save, sender=Book)
+def remember_old_author(sender, instance, raw=False, **kwargs):
+    instance._old_author = None
+    if not raw:
+        instance._old_author = Book.objects.filter(pk=instance.pk).values_list('author', flat=True).first()
+
+@receiver(post_save, sender=Book)
+def refresh_saved_author(sender, instance, **kwargs):
+    Author.refresh(instance.author)
+    old_author = getattr(instance, '_old_author', None)
+    if old_author is not None and old_author != instance.author:
+        Author.refresh(old_author)
+
+@receiver(post_delete, sender=Book)
+def refresh_deleted_author(sender, instance, **kwargs):
+    Author.refresh(instance.author)
+
+
+#drop cached catalog pages built from whatever changed (see caching.py)
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_book_pages(sender, instance, **kwargs):
+    caching.invalidate('books', 'book:%s' % instance.isbn)
+
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+def invalidate_author_pages(sender, instance, **kwargs):
+    caching.invalidate('authors', 'author:%s' % instance.name)
+
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+def invalidate_listing_pages(sender, instance, **kwargs):
+    caching.invalidate('book:%s' % instance.isbn_id, 'listing:%s' % instance.id)
+
+
+#site wide counts shown on the dashboards (see stats.py)
+@receiver(post_save, sender=Book)
+def count_saved_book(sender, instance, created, **kwargs):
+    if created:
+        record_catalog_change(books=1)
+
+@receiver(post_delete, sender=Book)
+def count_deleted_book(sender, instance, **kwargs):
+    record_catalog_change(books=-1)
+
+@receiver(post_save, sender=Listing)
+def count_saved_listing(sender, instance, created, **kwargs):
+    if created:
+        record_catalog_change(listings=1)
+
+@receiver(post_delete, sender=Listing)
+def count_deleted_listing(sender, instance, **kwargs):
+    record_catalog_change(listings=-1)
+
+@receiver(post_save, sender=CustomUser)
+def count_saved_seller(sender, instance, created, **kwargs):
+    if created and instance.type == 'Seller':
+        record_catalog_change(sellers=1)
+
+@receiver(post_delete, sender=CustomUser)
+def count_deleted_seller(sender, instance, **kwargs):
+    if instance.type == 'Seller':
+        record_catalog_change(sellers=-1)
+
+
+#resized copies of uploaded listing images (see thumbnails.py)
+@receiver(post_save, sender=Image)
+def thumbnail_saved_image(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        #made by the run_jobs worker, not in the upload request
+        jobs.enqueue('thumbnails', image_id=instance.id)
+
+@receiver(pre_delete, sender=Image)
+def touch_listings_losing_image(sender, instance, **kwargs):
+    #the delete clears Listing.image with an update(), which skips the listings' own signals
+    listing_ids = list(Listing.objects.filter(image=instance).values_list('id', flat=True))
+    if listing_ids:
+        Listing.objects.filter(id__in=listing_ids).update(version=F('version') + 1)
+        caching.touch_listings(listing_ids)
+
+@receiver(post_delete, sender=Image)
+def remove_deleted_thumbnails(sender, instance, **kwargs):
+    thumbnails.remove_thumbnails(instance)
@@ -0,0 +1,158 @@
+from django.db import connection
+from django.db.models import Case, Count, F, FloatField, Q, Sum, When
+from django.db.models.functions import Coalesce
+
+from .models import Book, CatalogStats, CustomUser, Listing, SellerStats, SellerDailyStats
+from . import caching
+
+
+'''
+Seller revenue ledger.
+
+SellerStats keeps each seller's lifetime totals and SellerDailyStats the same
+totals per order date, so the seller pages read one row instead of adding up
+every order. checkout, deliver_order and return_order call the record_*
+functions inside their transactions; rebuild_seller_stats recomputes both
+tables from Order if they ever drift.
+'''
+
+STAT_FIELDS = ['revenue', 'units', 'undelivered', 'returns']
+DAILY_FIELDS = ['revenue', 'units', 'returns']
+
+
+def _apply(model, fields, changes, key_fields):
+    #changes maps a key tuple to {field: delta}; make sure the rows exist, then one UPDATE adds every delta
+    changes = {key: delta for key, delta in changes.items() if any(delta.values())}
+    if not changes:
+        return
+    model.objects.bulk_create(
+        [model(**dict(zip(key_fields, key))) for key in changes],
+        ignore_conflicts=True,
+    )
+    matches = Q()
+    for key in changes:
+        matches |= Q(**dict(zip(key_fields, key)))
+    model.objects.filter(matches).update(**{
+        field: Case(
+            *[When(Q(**dict(zip(key_fields, key))), then=F(field) + delta[field]) for key, delta in changes.items()],
+            default=F(field),
+        )
+        for field in fields
+    })
+
+def _record(orders, sign_revenue, undelivered, returns):
+    totals = {}
+    daily = {}
+    for order in orders:
+        revenue = sign_revenue * order.quantity * order.price
+        units = sign_revenue * order.quantity
+        total = totals.setdefault((order.seller_id,), dict.fromkeys(STAT_FIELDS, 0))
+        total['revenue'] += revenue
+        total['units'] += units
+        total['undelivered'] += undelivered
+        total['returns'] += returns
+        day = daily.setdefault((order.seller_id, order.date), dict.fromkeys(DAILY_FIELDS, 0))
+        day['revenue'] += revenue
+        day['units'] += units
+        day['returns'] += returns
+    _apply(SellerStats, STAT_FIELDS, totals, ['seller_id'])
+    _apply(SellerDailyStats, DAILY_FIELDS, daily, ['seller_id', 'date'])
+
+def record_sales(orders):
+    _record([order for order in orders if order.seller_id is not None], 1, 1, 0)
+
+def record_deliveries(orders):
+    _record([order for order in orders if order.seller_id is not None], 0, -1, 0)
+
+def record_returns(orders):
+    #only undelivered orders can be returned
+    _record([order for order in orders if order.seller_id is not None], -1, -1, 1)
+
+
+def lock_ledger():
+    '''
+    Makes record_* calls in other transactions wait until this transaction
+    ends, so a rebuild can't miss or double count an order placed meanwhile.
+    Reads aren't blocked. SQLite only ever runs one write transaction at a
+    time, so there is nothing more to do there.
+    '''
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('LOCK TABLE %s, %s IN EXCLUSIVE MODE' % (
+                connection.ops.quote_name(SellerStats._meta.db_table),
+                connection.ops.quote_name(SellerDailyStats._meta.db_table),
+            ))
+
+
+def seller_stats(seller):
+    '''Revenue, units sold, undelivered orders and returns for one seller, from their ledger row.'''
+    row = SellerStats.objects.filter(seller=seller).values(*STAT_FIELDS).first()
+    if row is None:
+        return {'revenue': 0, 'units': 0, 'undelivered': 0, 'returns': 0}
+    row['revenue'] = round(row['revenue'], 2)
+    return row
+
+def recent_daily_stats(seller, days):
+    return SellerDailyStats.objects.filter(seller=seller).order_by('-date')[:days]
+
+
+def aggregate_seller_stats(orders):
+    '''
+    Works the totals out from Order rows in the database, grouped by seller
+    (uses the (seller, delivered) index). Used to rebuild the ledger.
+    '''
+    kept = Q(returned=False)
+    return orders.values('seller').annotate(
+        revenue=Coalesce(Sum(F('quantity') * F('price'), filter=kept, output_field=FloatField()), 0.0),
+        units=Coalesce(Sum('quantity', filter=kept), 0),
+        undelivered=Count('id', filter=kept & Q(delivered=False)),
+        returns=Count('id', filter=Q(returned=True)),
+    ).order_by('seller')
+
+def aggregate_daily_stats(orders):
+    kept = Q(returned=False)
+    return orders.values('seller', 'date').annotate(
+        revenue=Coalesce(Sum(F('quantity') * F('price'), filter=kept, output_field=FloatField()), 0.0),
+        units=Coalesce(Sum('quantity', filter=kept), 0),
+        returns=Count('id', filter=Q(returned=True)),
+    ).order_by('seller', 'date')
+
+
+'''
+Site wide counts for the dashboards.
+
+One CatalogStats row holds how many books, listings and sellers there are,
+moved up and down by the signals as rows are created and deleted, so the
+dashboards never run COUNT(*) over the catalog. Reads come from the cache
+(see caching.py) until the row changes.
+'''
+
+CATALOG_FIELDS = ['books', 'listings', 'sellers']
+
+
+def count_catalog():
+    return {
+        'books': Book.objects.count(),
+        'listings': Listing.objects.count(),
+        'sellers': CustomUser.objects.filter(type='Seller').count(),
+    }
+
+def rebuild_catalog_stats():
+    counts = count_catalog()
+    CatalogStats.objects.update_or_create(id=1, defaults=counts)
+    caching.invalidate('catalog_stats')
+    return counts
+
+def record_catalog_change(**deltas):
+    '''Adds deltas like books=1 or listings=-2 to the catalog counts.'''
+    if not CatalogStats.objects.filter(id=1).update(**{field: F(field) + delta for field, delta in deltas.items()}):
+        #no row yet, counting from scratch includes this change
+        rebuild_catalog_stats()
+    caching.invalidate('catalog_stats')
+
+def catalog_stats():
+    def load():
+        row = CatalogStats.objects.filter(id=1).values(*CATALOG_FIELDS).first()
+        return row if row is not None else rebuild_catalog_stats()
+
+    return caching.cached('catalog_stats', [], ['catalog_stats'], load)
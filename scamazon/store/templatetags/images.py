@@ -0,0 +1,26 @@
+from django import template
+
+register = template.Library()
+
+CARD_WIDTH = 115
+
+
+@register.inclusion_tag('listing_image.html')
+def listing_image(image, alt=''):
+    '''
+    A listing picture for the cards: a <picture> offering the WebP and JPEG
+    thumbnails through srcset so the browser fetches the smallest one that
+    fills 115px. While the thumbnails are still being made it shows a placeholder;
+    images that have none (older uploads, unreadable files) fall back to the original.
+    '''
+    context = {'image': image, 'alt': alt, 'width': CARD_WIDTH}
+    smallest = image.smallest('jpeg') if image else None
+    if smallest is not None:
+        width, height, name = smallest
+        context.update({
+            'webp_srcset': image.srcset('webp'),
+            'jpeg_srcset': image.srcset('jpeg'),
+            'src': image.image.storage.url(name),
+            'height': round(height * CARD_WIDTH / width),
+        })
+    return context
@@ -68,6 +68,11 @@ class ListingFormTest(TestCase):
         form = ListingForm(data)
         self.assertFalse(form.is_valid())
 
+    def test_listing_form_strips_isbn(self):
+        form = ListingForm({"isbn":"978-0-306-40615-7", "quantity":"2", "price":"19.99"})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['isbn'], "9780306406157")
+
     def test_listing_form_quantity_false(self):
         data = {
             "isbn":"19364016403822",
@@ -101,7 +106,7 @@ class BookFormTest(TestCase):
         data = {
             "title":"Huckleberry Finn",
             "author":"Mark Twain",
-            "isbn":"7364590382738",
+            "isbn":"9780306406157",
             "pages":"362",
             "rating":"4.5"
             }
@@ -119,11 +124,34 @@ class BookFormTest(TestCase):
         form = BookForm(data)
         self.assertFalse(form.is_valid())
 
+    def test_book_form_isbn_checksum(self):
+        data = {
+            "title":"Huckleberry Finn",
+            "author":"Mark Twain",
+            "isbn":"9780306406158",
+            "pages":"362",
+            "rating":"4.5"
+            }
+        form = BookForm(data)
+        self.assertFalse(form.is_valid())
+
+    def test_book_form_isbn10_becomes_isbn13(self):
+        data = {
+            "title":"Huckleberry Finn",
+            "author":"Mark Twain",
+            "isbn":"0-306-40615-2",
+            "pages":"362",
+            "rating":"4.5"
+            }
+        form = BookForm(data)
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['isbn'], "9780306406157")
+
     def test_book_form_pages_false(self):
         data = {
             "title":"Huckleberry Finn",
             "author":"Mark Twain",
-            "isbn":"7364590382738",
+            "isbn":"9780306406157",
             "pages":"0",
             "rating":"4.5"
             }
@@ -135,7 +163,7 @@ class BookFormTest(TestCase):
         data = {
             "title":"Huckleberry Finn",
             "author":"Mark Twain",
-            "isbn":"7364590382738",
+            "isbn":"9780306406157",
             "pages":"0",
             "rating":"-4.5"
             }
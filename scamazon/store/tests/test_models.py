@@ -1,7 +1,20 @@
-from django.test import TestCase
-from store.models import CustomUser, Book, Image, Listing, Cart, Order
+from django.test import TestCase, override_settings
+from store.models import CustomUser, Book, Author, Image, Listing, Cart, Order, Job
+from store import jobs
+from store.search import search_books
+from django.core.management import call_command
+from io import StringIO, BytesIO
 from django.db import IntegrityError
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
+from django.conf import settings
+from django.utils import timezone
+import datetime
+import json
+import os
+import shutil
+import tempfile
+from PIL import Image as PILImage
 
 class BookTestCase(TestCase):
     def setUp(self):
@@ -91,6 +104,142 @@ class BookValidationTestCase(TestCase):
                 rating = 3.9,
                 description = "I don't know, look it up")
     
+class AuthorTestCase(TestCase):
+    def setUp(self):
+        Book.objects.create(
+            title = "Tress of the Emerald Sea (paperback)",
+            author = "Brandon Sanderson",
+            isbn = 9781399613385,
+            pages = 384,
+            rating = 3.0)
+
+        Book.objects.create(
+            title = "Tress of the Emerald Sea (hardcover)",
+            author = "Brandon Sanderson",
+            isbn = 9781250899651,
+            pages = 302,
+            rating = 4.0)
+
+    def test_author_summary_created(self):
+        #Tests the summary row follows the books
+        author = Author.objects.get(name = "Brandon Sanderson")
+        self.assertEqual(author.slug, "brandon-sanderson")
+        self.assertEqual(author.book_count, 2)
+        self.assertEqual(author.average_rating, 3.5)
+
+    def test_author_summary_follows_changes(self):
+        book = Book.objects.get(isbn = 9781399613385)
+        book.author = "Someone Else"
+        book.save()
+        self.assertEqual(Author.objects.get(name = "Brandon Sanderson").book_count, 1)
+        self.assertEqual(Author.objects.get(name = "Someone Else").book_count, 1)
+
+        Book.objects.get(isbn = 9781250899651).delete()
+        self.assertFalse(Author.objects.filter(name = "Brandon Sanderson").exists())
+
+    def test_author_slugs_are_unique(self):
+        Book.objects.create(title = "Another", author = "Brandon  Sanderson!", isbn = 1, pages = 10, rating = 1)
+        self.assertEqual(Author.objects.get(name = "Brandon  Sanderson!").slug, "brandon-sanderson-2")
+
+    def test_rebuild_authors(self):
+        #bulk_create skips the signals, the rebuild command catches up
+        Book.objects.bulk_create([Book(title = "Bulk", author = "Bulk Author", isbn = 2, pages = 10, rating = 2)])
+        Author.objects.filter(name = "Brandon Sanderson").update(book_count = 7)
+        call_command('rebuild_authors', stdout = StringIO())
+        self.assertEqual(Author.objects.get(name = "Bulk Author").book_count, 1)
+        self.assertEqual(Author.objects.get(name = "Brandon Sanderson").book_count, 2)
+
+    def test_rebuild_authors_slugs_are_unique(self):
+        #two new names with the same slug, and one that collides with an existing author
+        Book.objects.bulk_create([
+            Book(title = "One", author = "Ann Lee", isbn = 3, pages = 10, rating = 2),
+            Book(title = "Two", author = "ann lee", isbn = 4, pages = 10, rating = 2),
+            Book(title = "Three", author = "Brandon  Sanderson", isbn = 5, pages = 10, rating = 2),
+        ])
+        call_command('rebuild_authors', stdout = StringIO())
+        self.assertEqual(sorted(Author.objects.filter(name__iexact = "ann lee").values_list('slug', flat = True)), ['ann-lee', 'ann-lee-2'])
+        self.assertEqual(Author.objects.get(name = "Brandon  Sanderson").slug, 'brandon-sanderson-2')
+
+class ImportCatalogTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        Book.objects.create(title = "Old Title", author = "Old Author", isbn = 9781399613385, pages = 384, rating = 3.0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_import_csv_upserts_and_rejects(self):
+        path = self.write('books.csv', "isbn,title,author,pages,rating,description\n"
+            "9781399613385,New Title,New Author,400,4.5,\n"
+            "9781250899651,Second,New Author,302,4,A book\n"
+            "12345678901234,Too Long,Someone,10,1,\n"
+            "9780000000001,Bad Rating,Someone,10,9,\n")
+        out = StringIO()
+        err = StringIO()
+        call_command('import_catalog', path, '--batch-size', '1', stdout = out, stderr = err)
+        self.assertIn("2 books imported, 2 rejected", out.getvalue())
+        self.assertIn("Row 3 rejected: isbn", err.getvalue())
+        self.assertEqual(Book.objects.get(isbn = 9781399613385).title, "New Title")
+        self.assertEqual(Book.objects.count(), 2)
+        #the summaries the signals would have kept
+        self.assertEqual(Author.objects.get(name = "New Author").book_count, 2)
+        self.assertFalse(Author.objects.filter(name = "Old Author").exists())
+
+    def test_import_jsonl_writes_rejects_file(self):
+        path = self.write('books.jsonl', '{"isbn": "9781250899651", "title": "Second", "author": "A", "pages": 302, "rating": 4}\n'
+            'not json\n'
+            '{"isbn": "9781250899651", "title": "Second Again", "author": "A", "pages": 302, "rating": 4}\n')
+        rejects = os.path.join(self.directory, 'rejects.jsonl')
+        call_command('import_catalog', path, '--rejects', rejects, stdout = StringIO())
+        self.assertEqual(Book.objects.get(isbn = 9781250899651).title, "Second Again")
+        self.assertEqual([book.title for book in search_books("again", 10)[0]], ["Second Again"])
+        with open(rejects) as f:
+            self.assertEqual([json.loads(line)['line'] for line in f], [2])
+
+class ImportListingsTestCase(TestCase):
+    def test_import_listings_writes_report(self):
+        seller = CustomUser.objects.create_user(username = 'seller', password = 'password', type = 'Seller')
+        Book.objects.create(title = "Title", author = "Author", isbn = 9781399613385, pages = 384, rating = 3.0)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'listings.csv')
+        with open(path, 'w') as f:
+            f.write("isbn,quantity,price\n9781399613385,3,12.5\n9780000000001,1,5\n9781399613385,2,10\n")
+        report = os.path.join(directory, 'report.jsonl')
+        out = StringIO()
+        call_command('import_listings', 'seller', path, '--report', report, '--batch-size', '2', stdout = out)
+        self.assertIn("2 listings created, 1 rejected", out.getvalue())
+        self.assertEqual(sorted(Listing.objects.filter(userID = seller).values_list('quantity', flat = True)), [2, 3])
+        with open(report) as f:
+            self.assertEqual([json.loads(line)['status'] for line in f], ['created', 'rejected', 'created'])
+
+class ExportDataTestCase(TestCase):
+    def test_export_books_as_jsonl(self):
+        Book.objects.create(title = "Title", author = "Author", isbn = 9781399613385, pages = 384, rating = 3.0, description = "Two\nlines")
+        Book.objects.create(title = "Other", author = "Author", isbn = 9781250899651, pages = 10, rating = 1.0)
+        out = StringIO()
+        call_command('export_data', 'books', '--format', 'jsonl', '--chunk-size', '1', stdout = out, stderr = StringIO())
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row['isbn'] for row in rows], ['9781250899651', '9781399613385'])
+        self.assertEqual(rows[1]['description'], "Two\nlines")
+
+    def test_export_orders_leaves_out_payment(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'orders.csv')
+        Order.objects.create(date = '2024-04-16', quantity = 1, price = 10, address = '1 St', payment = '1234123412341234')
+        call_command('export_data', 'orders', '-o', path, stderr = StringIO())
+        with open(path) as f:
+            text = f.read()
+        self.assertTrue(text.startswith('id,date,book'))
+        self.assertNotIn('1234123412341234', text)
+
 class CustomUserTestCase(TestCase):
     def test_custom_field_validation(self):
         #Test if type field is set correctly
@@ -127,6 +276,126 @@ class ImageTestCase(TestCase):
         #Test if image is stored properly
         self.assertTrue(image_object.image.name.startswith("test_image"))
         
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ThumbnailTestCase(TestCase):
+    def tearDown(self):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def upload(self, size):
+        #a phone style photo: EXIF with a GPS block and a "rotate 90" orientation
+        exif = PILImage.Exif()
+        exif[0x0112] = 6
+        exif[0x8825] = {1: 'N'}
+        buffer = BytesIO()
+        PILImage.new('RGB', size, 'red').save(buffer, format='JPEG', exif=exif)
+        image = Image.objects.create(image=SimpleUploadedFile("photo.jpg", buffer.getvalue(), content_type="image/jpeg"))
+        self.assertTrue(image.pending)
+        call_command('run_jobs', '--once', '--processes', '0', stdout=StringIO())
+        return Image.objects.get(id=image.id)
+
+    def test_upload_makes_thumbnails(self):
+        image = self.upload((2000, 1000))
+        self.assertFalse(image.pending)
+        self.assertEqual(Job.objects.count(), 0)
+        self.assertEqual([width for width, height, name in image.variants['webp']], [115, 230, 460])
+        width, height, name = image.smallest('jpeg')
+        #rotated upright: portrait
+        self.assertEqual((width, height), (115, 230))
+        with PILImage.open(image.image.storage.open(name)) as thumbnail:
+            self.assertEqual(len(thumbnail.getexif()), 0)
+        self.assertIn('115w', image.srcset('webp'))
+
+    def test_original_loses_its_metadata(self):
+        image = self.upload((300, 200))
+        with PILImage.open(image.image.storage.open(image.image.name)) as original:
+            self.assertEqual(len(original.getexif()), 0)
+            #stored upright now that the orientation tag is gone
+            self.assertEqual(original.size, (200, 300))
+
+    def test_small_upload_is_not_upscaled(self):
+        image = self.upload((150, 100))
+        self.assertEqual([width for width, height, name in image.variants['jpeg']], [100])
+
+    def test_delete_removes_thumbnails(self):
+        image = self.upload((300, 300))
+        names = [name for variants in image.variants.values() for width, height, name in variants]
+        image.delete()
+        self.assertFalse(any(default_storage.exists(name) for name in names))
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ImageDedupTestCase(TestCase):
+    def tearDown(self):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def photo(self, colour):
+        buffer = BytesIO()
+        PILImage.new('RGB', (50, 50), colour).save(buffer, format='JPEG')
+        return SimpleUploadedFile("Cover.JPG", buffer.getvalue(), content_type="image/jpeg")
+
+    def test_same_upload_shares_one_image(self):
+        first = Image.from_upload(self.photo('red'))
+        second = Image.from_upload(self.photo('red'))
+        other = Image.from_upload(self.photo('blue'))
+        self.assertEqual(first.id, second.id)
+        self.assertNotEqual(first.id, other.id)
+        self.assertEqual(first.image.name, first.sha256 + '.jpg')
+        self.assertEqual(len(os.listdir(settings.MEDIA_ROOT)), 2)
+
+    def test_dedup_command_merges_existing_images(self):
+        seller = CustomUser.objects.create_user(username='seller', password='password', type='Seller')
+        book = Book.objects.create(title='Gadsby', author='Ernest Wright', isbn=9781466216730, pages=260, rating=4.2)
+        images = [Image.objects.create(image=self.photo('red')) for number in range(3)]
+        listings = [Listing.objects.create(listingID=0, isbn=book, userID=seller, price=5, image=image) for image in images]
+        order = Order.objects.create(date='2024-04-16', book=book, seller=seller, oldListingImage=images[2])
+
+        #the old files are deleted once the merge commits
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('dedup_images', stdout=StringIO())
+        keeper = Image.objects.get()
+        self.assertEqual(keeper.id, images[0].id)
+        self.assertEqual(keeper.image.name, keeper.sha256 + '.jpg')
+        self.assertEqual(set(Listing.objects.values_list('image_id', flat=True)), {keeper.id})
+        self.assertEqual(Order.objects.get(id=order.id).oldListingImage_id, keeper.id)
+        self.assertEqual(os.listdir(settings.MEDIA_ROOT), [keeper.image.name])
+        #uploading it again now finds the merged row
+        self.assertEqual(Image.from_upload(self.photo('red')).id, keeper.id)
+
+class JobTestCase(TestCase):
+    def setUp(self):
+        self.calls = []
+        jobs.handler('test_ok')(lambda value: self.calls.append(value))
+        jobs.handler('test_broken', on_failure=lambda value: self.calls.append('gave up'))(lambda value: 1 / 0)
+
+    def test_job_runs_and_is_deleted(self):
+        jobs.enqueue('test_ok', value=3)
+        self.assertEqual(jobs.run_inline(), 1)
+        self.assertEqual(self.calls, [3])
+        self.assertEqual(Job.objects.count(), 0)
+
+    def test_failed_job_is_retried_later_then_given_up(self):
+        job = jobs.enqueue('test_broken', value=1)
+        jobs.run_inline()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.PENDING, 1))
+        self.assertIn('ZeroDivisionError', job.last_error)
+        #waiting for its retry time
+        self.assertEqual(jobs.run_inline(), 0)
+
+        for attempt in range(settings.JOB_MAX_ATTEMPTS - 1):
+            Job.objects.update(run_after=timezone.now())
+            jobs.run_inline()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(self.calls, ['gave up'])
+
+    def test_claimed_job_is_not_claimed_twice(self):
+        jobs.enqueue('test_ok', value=1)
+        self.assertEqual(len(jobs.claim(10, worker='a')), 1)
+        self.assertEqual(jobs.claim(10, worker='b'), [])
+        #until the first worker's lock runs out
+        later = timezone.now() + datetime.timedelta(seconds=settings.JOB_LOCK_SECONDS + 1)
+        self.assertEqual(len(jobs.claim(10, worker='b', now=later)), 1)
+
 class ListingTestCase(TestCase):
     def setUp(self):
         self.book = Book.objects.create(
@@ -315,6 +584,14 @@ class OrderTestCase(TestCase):
         #Tests if get_total_payment() functions properly
         self.assertEqual(self.order.get_total_payment(), 4.68)
         
+    def test_deleting_image_keeps_listing_and_order(self):
+        version = Listing.objects.get(id=self.listing.id).version
+        self.image_object.delete()
+        listing = Listing.objects.get(id=self.listing.id)
+        self.assertIsNone(listing.image_id)
+        self.assertEqual(listing.version, version + 1)
+        self.assertIsNone(Order.objects.get(id=self.order.id).oldListingImage_id)
+
     def test_order_required_fields_populated(self):
         #Test default behavior of model    
         with self.assertRaises(IntegrityError):
@@ -1,9 +1,24 @@
 from typing import Any
-from django.test import TestCase
+from unittest import mock
+import datetime
+import json
+import tempfile
+import threading
+from io import StringIO
+from django.test import TestCase, override_settings
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
+from django.utils import timezone
+from django.core.management import call_command
 
-from store.models import Book, Listing, Cart, CustomUser
+from store.models import Book, Listing, Cart, CustomUser, Order, SellerStats, SellerDailyStats, CatalogStats
+from store import autocomplete, caching
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
 from store.forms import SignupForm, CheckoutForm, BookForm
+from store.reservations import reserve, change_cart_quantity, remove_from_cart
+from store.pagination import encode_cursor
 
 ''' 
 Function that can populate the whole db for testing
@@ -163,6 +178,39 @@ class BrowseBookViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.context['book_list'][4]['author'], "Author 4")
 
+    def test_page_size_limits_books(self):
+        login = self.client.login(username='testbuyer1', password='group4se')
+        response = self.client.get('/browse-books/?size=2')
+        self.assertEqual(len(response.context['book_list']), 2)
+        self.assertTrue(response.context['page'].has_next())
+        self.assertFalse(response.context['page'].has_previous())
+
+    def test_next_and_previous_cursors(self):
+        login = self.client.login(username='testbuyer1', password='group4se')
+        response = self.client.get('/browse-books/?size=2')
+        next_cursor = response.context['page'].next_cursor
+
+        response = self.client.get('/browse-books/?size=2&after=' + next_cursor)
+        self.assertEqual([book['title'] for book in response.context['book_list']], ["Book 2", "Book 3"])
+        prev_cursor = response.context['page'].prev_cursor
+
+        response = self.client.get('/browse-books/?size=2&before=' + prev_cursor)
+        self.assertEqual([book['title'] for book in response.context['book_list']], ["Book 0", "Book 1"])
+        self.assertFalse(response.context['page'].has_previous())
+
+    def test_last_page_has_no_next(self):
+        login = self.client.login(username='testbuyer1', password='group4se')
+        response = self.client.get('/browse-books/?size=3')
+        response = self.client.get('/browse-books/?size=3&after=' + response.context['page'].next_cursor)
+        self.assertEqual(len(response.context['book_list']), 2)
+        self.assertFalse(response.context['page'].has_next())
+
+    def test_bad_cursor_starts_over(self):
+        login = self.client.login(username='testbuyer1', password='group4se')
+        response = self.client.get('/browse-books/?after=garbage')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['book_list'][0]['title'], "Book 0")
+
 class BuyerDashboardViewTest(TestCase):
     def setUp(self):
         self.test_user = CustomUser.objects.create_user(username='testbuyer1', password='group4se', type="Buyer")
@@ -191,6 +239,26 @@ class BuyerDashboardViewTest(TestCase):
         response = self.client.get('/buyer/')
         self.assertEqual(response.context['user_type'], 'Buyer')
 
+    def test_catalog_counts_follow_changes(self):
+        login = self.client.login(username='testbuyer1', password='group4se')
+        CustomUser.objects.create_user(username='testseller1', password='group4se', type="Seller")
+        self.book3.delete()
+        response = self.client.get('/buyer/')
+        self.assertEqual(response.context['catalog'], {'books': 2, 'listings': 0, 'sellers': 1})
+        with self.assertNumQueries(2):
+            self.client.get('/buyer/')
+
+    def test_router_does_not_count(self):
+        login = self.client.login(username='testbuyer1', password='group4se')
+        with self.assertNumQueries(2):
+            response = self.client.get('/')
+        self.assertRedirects(response, '/buyer/')
+
+    def test_rebuild_catalog_stats(self):
+        CatalogStats.objects.update(books=100)
+        call_command('rebuild_catalog_stats', stdout=StringIO())
+        self.assertEqual(CatalogStats.objects.get().books, 3)
+
 class BrowseAuthorViewTest(TestCase):
 
     def setUp(self):
@@ -239,6 +307,44 @@ class BrowseAuthorViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.context['authors'][4]['author'], "Author 4")
 
+    def test_author_book_counts(self):
+        Book.objects.create(title='Book 9', author='Author 4', isbn=9, pages=200, rating=4)
+        login = self.client.login(username='testbuyer1', password='group4se')
+        response = self.client.get('/browse-authors/')
+        self.assertEqual(len(response.context['authors']), 5)
+        self.assertEqual(response.context['authors'][4]['book_count'], 2)
+
+    def test_author_letter_bucket(self):
+        Book.objects.create(title='Book 9', author='Zadie Smith', isbn=9, pages=200, rating=4)
+        Book.objects.create(title='Book 10', author='zora neale hurston', isbn=10, pages=200, rating=4)
+        Book.objects.create(title='Book 11', author='50 Cent', isbn=11, pages=200, rating=4)
+        login = self.client.login(username='testbuyer1', password='group4se')
+        response = self.client.get('/browse-authors/?letter=z')
+        self.assertEqual([author['author'] for author in response.context['authors']], ['Zadie Smith', 'zora neale hurston'])
+        response = self.client.get('/browse-authors/?letter=%23')
+        self.assertEqual([author['author'] for author in response.context['authors']], ['50 Cent'])
+
+    def test_author_letter_ignores_accents_and_punctuation(self):
+        Book.objects.create(title='Book 9', author='Émile Zola', isbn=9, pages=200, rating=4)
+        Book.objects.create(title='Book 10', author="'Evelyn Waugh'", isbn=10, pages=200, rating=4)
+        Book.objects.create(title='Book 11', author='Ørjan Nilsen', isbn=11, pages=200, rating=4)
+        login = self.client.login(username='testbuyer1', password='group4se')
+        response = self.client.get('/browse-authors/?letter=e')
+        self.assertEqual([author['author'] for author in response.context['authors']], ["'Evelyn Waugh'", 'Émile Zola'])
+        response = self.client.get('/browse-authors/?letter=%23')
+        self.assertEqual([author['author'] for author in response.context['authors']], ['Ørjan Nilsen'])
+
+    def test_author_pages(self):
+        login = self.client.login(username='testbuyer1', password='group4se')
+        response = self.client.get('/browse-authors/?size=3')
+        self.assertEqual(len(response.context['authors']), 3)
+        response = self.client.get('/browse-authors/?size=3&after=' + response.context['page'].next_cursor)
+        self.assertEqual([author['author'] for author in response.context['authors']], ['Author 3', 'Author 4'])
+
+    def test_login_required(self):
+        response = self.client.get('/browse-authors/')
+        self.assertEqual(response.status_code, 302)
+
 class AuthorViewTest(TestCase):
     def setUp(self):
         # Create 5 books for tests
@@ -295,6 +401,13 @@ class AuthorViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'null_author.html')
 
+    def test_view_by_slug(self):
+        login = self.client.login(username='testbuyer1', password='group4se')
+        response = self.client.get('/authors/author-4/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['book_list']), 2)
+        self.assertEqual(response.context['author'].book_count, 2)
+
 class BookViewTest(TestCase):
     def setUp(self):
         book1 = Book.objects.create(
@@ -371,6 +484,12 @@ class BookViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.context['listing_list']), 0)
 
+    def test_other_isbn_forms_redirect_to_the_book(self):
+        Book.objects.create(title='Ten', author='Someone', isbn='9780306406157', pages=10, rating=3)
+        login = self.client.login(username='testbuyer1', password='group4se')
+        response = self.client.get('/books/0-306-40615-2/')
+        self.assertRedirects(response, '/books/9780306406157/', status_code=301)
+
 class AddToCartViewTest(TestCase):
     def setUp(self):
         book1 = Book.objects.create(
@@ -503,6 +622,33 @@ class PullCartViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.context['cart'][1].listingID.price, 19.99)
 
+    def test_cart_totals(self):
+        Cart.objects.filter(listingID=2).update(quantity=2)
+        login = self.client.login(username='testbuyer1', password='group4se')
+        response = self.client.get('/cart/')
+        self.assertEqual(round(response.context['cart'][1].line_total, 2), 39.98)
+        self.assertEqual(response.context['subtotal'], 64.97)
+
+    def test_query_count_does_not_grow_with_cart(self):
+        #session, user and one cart query no matter how many items are in the cart
+        login = self.client.login(username='testbuyer1', password='group4se')
+        with self.assertNumQueries(3):
+            self.client.get('/cart/')
+
+        seller = CustomUser.objects.get(username='testseller1')
+        for number in range(5):
+            listing = Listing.objects.create(listingID=10 + number, isbn=Book.objects.get(isbn=400), quantity=1, userID=seller, price=5)
+            Cart.objects.create(listingID=listing, quantity=1, userID=CustomUser.objects.get(username='testbuyer1'))
+        with self.assertNumQueries(3):
+            response = self.client.get('/cart/')
+        self.assertEqual(len(response.context['cart']), 7)
+
+    def test_empty_cart(self):
+        Cart.objects.all().delete()
+        login = self.client.login(username='testbuyer1', password='group4se')
+        response = self.client.get('/cart/')
+        self.assertEqual(response.context['subtotal'], 0)
+
 class CheckoutViewTest(TestCase):
     def setUp(self):
         populateDB()
@@ -539,6 +685,33 @@ class CheckoutViewTest(TestCase):
         response = self.client.post('/checkout/', {'checkout': True, 'address': '1234 Example st', 'paymentType': 'Visa', 'cardNum': '1234123412341234', 'CVV': '123', 'Expiration': '12/24'})
         self.assertEqual(Listing.objects.count(), 1)
 
+    def test_checkout_creates_orders_and_decrements(self):
+        login = self.client.login(username='testbuyer1', password='group4se')
+        response = self.client.post('/checkout/', {'checkout': True, 'address': '1234 Example st', 'paymentType': 'Visa', 'cardNum': '1234123412341234', 'CVV': '123', 'Expiration': '12/24'})
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(Listing.objects.get(listingID=2).quantity, 1)
+        self.assertEqual(Order.objects.get(oldListingId=Listing.objects.get(listingID=2).id).price, 19.99)
+
+    def test_checkout_reports_out_of_stock_and_changes_nothing(self):
+        #someone else bought the only copy of listing 1
+        Listing.objects.filter(listingID=1).update(quantity=0)
+        login = self.client.login(username='testbuyer1', password='group4se')
+        response = self.client.post('/checkout/', {'checkout': True, 'address': '1234 Example st', 'paymentType': 'Visa', 'cardNum': '1234123412341234', 'CVV': '123', 'Expiration': '12/24'}, follow=True)
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(Cart.objects.count(), 2)
+        self.assertEqual(Listing.objects.get(listingID=2).quantity, 2)
+        self.assertEqual(len(list(response.context['messages'])), 1)
+
+    def test_checkout_query_count_does_not_grow_with_cart(self):
+        login = self.client.login(username='testbuyer1', password='group4se')
+        seller = CustomUser.objects.get(username='testseller1')
+        for number in range(5):
+            listing = Listing.objects.create(listingID=10 + number, isbn=Book.objects.get(isbn=400), quantity=3, userID=seller, price=5)
+            Cart.objects.create(listingID=listing, quantity=1, userID=CustomUser.objects.get(username='testbuyer1'))
+        with self.assertNumQueries(18):
+            response = self.client.post('/checkout/', {'checkout': True, 'address': '1234 Example st', 'paymentType': 'Visa', 'cardNum': '1234123412341234', 'CVV': '123', 'Expiration': '12/24'})
+        self.assertEqual(Order.objects.count(), 7)
+
 class SearchViewTest(TestCase):
     def setUp(self):
         populateDB()
@@ -560,6 +733,13 @@ class SearchViewTest(TestCase):
         self.assertTemplateUsed(response, 'browse_books.html')
         self.assertEqual(len(response.context['book_list']), 1)
 
+    def test_search_by_isbn_in_any_form(self):
+        book = Book.objects.create(title='Ten', author='Someone', isbn='9780306406157', pages=10, rating=3)
+        login = self.client.login(username='testbuyer1', password='group4se')
+        for search in ['978-0-306-40615-7', '0 306 40615 2']:
+            response = self.client.post('/search/', {'search': search})
+            self.assertEqual(response.context['book_list'], [book])
+
     def test_search_by_author(self):
         login = self.client.login(username='testbuyer1', password='group4se')
         response = self.client.post('/search/', {'search': 'Author 4'})
@@ -571,7 +751,110 @@ class SearchViewTest(TestCase):
         response = self.client.post('/search/', {'search': '400'})
         self.assertTemplateUsed(response, 'browse_books.html')
         self.assertEqual(len(response.context['book_list']), 1)
-        
+
+    def test_search_by_prefix(self):
+        login = self.client.login(username='testbuyer1', password='group4se')
+        response = self.client.post('/search/', {'search': 'Auth'})
+        self.assertTemplateUsed(response, 'browse_books.html')
+        self.assertEqual(len(response.context['book_list']), 2)
+
+    def test_search_ranks_title_above_description(self):
+        Book.objects.create(title='Example Stories', author='Someone Else', isbn=600, pages=10, rating=3)
+        login = self.client.login(username='testbuyer1', password='group4se')
+        response = self.client.post('/search/', {'search': 'example'})
+        self.assertEqual(len(response.context['book_list']), 3)
+        self.assertEqual(response.context['book_list'][0].title, 'Example Stories')
+
+    def test_search_index_follows_updates_and_deletes(self):
+        book = Book.objects.get(isbn=200)
+        book.title = 'Renamed Volume'
+        book.save()
+        Book.objects.get(isbn=400).delete()
+        login = self.client.login(username='testbuyer1', password='group4se')
+        response = self.client.post('/search/', {'search': 'renamed'})
+        self.assertEqual(len(response.context['book_list']), 1)
+        response = self.client.post('/search/', {'search': 'Book 400'})
+        self.assertTemplateUsed(response, 'null_search.html')
+
+    def test_search_pages(self):
+        login = self.client.login(username='testbuyer1', password='group4se')
+        response = self.client.get('/search/', {'search': 'Author', 'size': 1})
+        self.assertEqual(len(response.context['book_list']), 1)
+        self.assertEqual(response.context['search_page']['next'], 2)
+        first = response.context['book_list'][0]
+        response = self.client.get('/search/', {'search': 'Author', 'size': 1, 'page': 2})
+        self.assertEqual(len(response.context['book_list']), 1)
+        self.assertNotEqual(response.context['book_list'][0], first)
+        self.assertIsNone(response.context['search_page']['next'])
+
+    @override_settings(SEARCH_MAX_RESULTS=1)
+    def test_search_page_is_capped(self):
+        login = self.client.login(username='testbuyer1', password='group4se')
+        response = self.client.get('/search/', {'search': 'Author', 'size': 1, 'page': 10 ** 30})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['search_page']['number'], 1)
+        self.assertIsNone(response.context['search_page']['next'])
+
+class AutocompleteViewTest(TestCase):
+    def setUp(self):
+        populateDB()
+        Book.objects.create(title='Harry Potter', author='J. K. Rowling', isbn=500, pages=300, rating=5)
+        #the index is shared by the whole process so start every test from the db
+        autocomplete.index.clear()
+
+    def test_view_returns_json(self):
+        login = self.client.login(username='testbuyer1', password='group4se')
+        response = self.client.get('/autocomplete/', {'q': 'har'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['label'], 'Harry Potter')
+        self.assertEqual(response.json()['results'][0]['url'], '/books/500/')
+
+    def test_matches_later_words(self):
+        login = self.client.login(username='testbuyer1', password='group4se')
+        response = self.client.get('/autocomplete/', {'q': 'pott'})
+        self.assertEqual([result['label'] for result in response.json()['results']], ['Harry Potter'])
+
+    def test_author_listed_once(self):
+        login = self.client.login(username='testbuyer1', password='group4se')
+        response = self.client.get('/autocomplete/', {'q': 'author'})
+        self.assertEqual(response.json()['results'], [{'type': 'author', 'label': 'Author 4', 'url': '/author/Author%204/'}])
+
+    def test_limit(self):
+        login = self.client.login(username='testbuyer1', password='group4se')
+        response = self.client.get('/autocomplete/', {'q': 'book', 'limit': 1})
+        self.assertEqual(len(response.json()['results']), 1)
+
+    def test_follows_book_changes(self):
+        login = self.client.login(username='testbuyer1', password='group4se')
+        self.client.get('/autocomplete/', {'q': 'har'})
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.create(title='Hard Times', author='Charles Dickens', isbn=600, pages=300, rating=4)
+            Book.objects.get(isbn=500).delete()
+        response = self.client.get('/autocomplete/', {'q': 'har'})
+        self.assertEqual([result['label'] for result in response.json()['results']], ['Hard Times'])
+
+    def test_guests_get_suggestions(self):
+        response = self.client.get('/autocomplete/', {'q': 'har'})
+        self.assertEqual(response.json()['results'][0]['label'], 'Harry Potter')
+
+    def test_labels_starting_with_prefix_come_first(self):
+        for n in range(12):
+            Book.objects.create(title='A Harbour %d' % n, author='Someone', isbn=700 + n, pages=10, rating=3)
+        #'harry potter' sorts after every 'harbour ...' word key
+        results = autocomplete.index.suggest('har', 5)
+        self.assertEqual(results[0]['label'], 'Harry Potter')
+        self.assertEqual(len(results), 5)
+
+    def test_stale_index_refreshes_in_background(self):
+        autocomplete.index.suggest('har', 5)
+        autocomplete.index.built_at -= settings.AUTOCOMPLETE_MAX_AGE + 1
+        with mock.patch.object(autocomplete.index, 'refresh_in_background') as refresh, \
+                mock.patch.object(autocomplete.index, 'build') as build:
+            results = autocomplete.index.suggest('har', 5)
+        refresh.assert_called_once()
+        build.assert_not_called()
+        self.assertEqual(results[0]['label'], 'Harry Potter')
+
 class IncreaseAndDecreaseCartViewsTest(TestCase):
     def setUp(self):
         populateDB()
@@ -611,6 +894,167 @@ class IncreaseAndDecreaseCartViewsTest(TestCase):
         response = self.client.post('/increase_cart_quantity/1', {'id': 1})
         self.assertEqual(Cart.objects.get(listingID=1).quantity,1)
 
+class CartHoldTest(TestCase):
+    def setUp(self):
+        populateDB()
+        CustomUser.objects.create_user(username='testbuyer2', password='group4se', type="Buyer")
+        self.listing = Listing.objects.get(listingID=1)
+
+    def test_adding_to_cart_holds_a_copy(self):
+        login = self.client.login(username='testbuyer2', password='group4se')
+        response = self.client.post('/add_cart/1', {'id': self.listing.id})
+        self.assertEqual(Listing.objects.get(id=self.listing.id).reserved, 1)
+        self.assertEqual(Cart.objects.get(userID__username='testbuyer2').reserved, 1)
+
+    def test_held_copies_cannot_be_carted(self):
+        login = self.client.login(username='testbuyer2', password='group4se')
+        response = self.client.post('/add_cart/1', {'id': self.listing.id})
+        self.client.logout()
+
+        CustomUser.objects.create_user(username='testbuyer3', password='group4se', type="Buyer")
+        login = self.client.login(username='testbuyer3', password='group4se')
+        response = self.client.post('/add_cart/1', {'id': self.listing.id}, follow=True)
+        self.assertFalse(Cart.objects.filter(userID__username='testbuyer3').exists())
+        self.assertEqual(len(list(response.context['messages'])), 1)
+
+    def test_expired_holds_are_released(self):
+        login = self.client.login(username='testbuyer2', password='group4se')
+        response = self.client.post('/add_cart/1', {'id': self.listing.id})
+        Cart.objects.filter(userID__username='testbuyer2').update(reserved_until=timezone.now() - datetime.timedelta(minutes=1))
+
+        call_command('release_expired_holds', stdout=StringIO())
+        self.assertEqual(Listing.objects.get(id=self.listing.id).reserved, 0)
+        self.assertEqual(Cart.objects.get(userID__username='testbuyer2').reserved, 0)
+
+    def test_expired_holds_are_released_when_needed(self):
+        login = self.client.login(username='testbuyer2', password='group4se')
+        response = self.client.post('/add_cart/1', {'id': self.listing.id})
+        Cart.objects.filter(userID__username='testbuyer2').update(reserved_until=timezone.now() - datetime.timedelta(minutes=1))
+        self.client.logout()
+
+        CustomUser.objects.create_user(username='testbuyer3', password='group4se', type="Buyer")
+        login = self.client.login(username='testbuyer3', password='group4se')
+        response = self.client.post('/add_cart/1', {'id': self.listing.id})
+        self.assertEqual(Cart.objects.get(userID__username='testbuyer3').reserved, 1)
+        self.assertEqual(Listing.objects.get(id=self.listing.id).reserved, 1)
+
+    def test_decrease_and_remove_release_holds(self):
+        listing = Listing.objects.get(listingID=2)
+        login = self.client.login(username='testbuyer2', password='group4se')
+        self.client.post('/add_cart/2', {'id': listing.id})
+        self.client.post('/increase_cart_quantity/2', {'id': listing.id})
+        self.assertEqual(Listing.objects.get(id=listing.id).reserved, 2)
+        self.client.post('/decrease_cart_quantity/2', {'id': listing.id})
+        self.assertEqual(Listing.objects.get(id=listing.id).reserved, 1)
+        self.client.post('/remove_cart/2', {'id': listing.id})
+        self.assertEqual(Listing.objects.get(id=listing.id).reserved, 0)
+
+    def test_cart_changes_apply_to_the_current_row(self):
+        listing = Listing.objects.get(listingID=2)
+        login = self.client.login(username='testbuyer2', password='group4se')
+        self.client.post('/add_cart/2', {'id': listing.id})
+        stale = Cart.objects.get(userID__username='testbuyer2')
+        self.client.post('/increase_cart_quantity/2', {'id': listing.id})
+        #the stale copy still says 1, going by it would remove the row
+        change_cart_quantity(stale, -1)
+        self.assertEqual(Cart.objects.get(userID__username='testbuyer2').quantity, 1)
+        self.assertEqual(Listing.objects.get(id=listing.id).reserved, 1)
+        remove_from_cart(stale)
+        remove_from_cart(stale)
+        self.assertEqual(Listing.objects.get(id=listing.id).reserved, 0)
+
+    def test_drifted_reserved_counts_are_repaired(self):
+        login = self.client.login(username='testbuyer2', password='group4se')
+        self.client.post('/add_cart/1', {'id': self.listing.id})
+        Listing.objects.filter(id=self.listing.id).update(reserved=-3)
+        out = StringIO()
+        call_command('release_expired_holds', stdout=out)
+        self.assertEqual(Listing.objects.get(id=self.listing.id).reserved, 1)
+        self.assertIn('repaired 1 listings', out.getvalue())
+
+    def test_checkout_uses_own_holds(self):
+        listing = Listing.objects.get(listingID=2)
+        Cart.objects.all().delete()
+        login = self.client.login(username='testbuyer2', password='group4se')
+        self.client.post('/add_cart/2', {'id': listing.id})
+        self.client.post('/increase_cart_quantity/2', {'id': listing.id})
+        response = self.client.post('/checkout/', {'checkout': True, 'address': '1234 Example st', 'paymentType': 'Visa', 'cardNum': '1234123412341234', 'CVV': '123', 'Expiration': '12/24'})
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertFalse(Listing.objects.filter(id=listing.id).exists())
+
+class CartQueryCountTest(TestCase):
+    def setUp(self):
+        populateDB()
+
+    def test_cart_clicks_use_a_fixed_number_of_queries(self):
+        login = self.client.login(username='testbuyer1', password='group4se')
+        #session, user, cart row lookup, then the locked re-read, hold and cart updates between a savepoint and its release
+        with self.assertNumQueries(8):
+            self.client.post('/increase_cart_quantity/2', {'id': 2})
+        with self.assertNumQueries(8):
+            self.client.post('/decrease_cart_quantity/2', {'id': 2})
+
+    def test_cart_rows_are_unique_per_listing(self):
+        login = self.client.login(username='testbuyer1', password='group4se')
+        self.client.post('/add_cart/1', {'id': 1})
+        self.assertEqual(Cart.objects.filter(listingID=1).count(), 1)
+
+class GuestCartTest(TestCase):
+    def setUp(self):
+        populateDB()
+        self.listing = Listing.objects.get(listingID=2)
+
+    def test_guest_add_uses_cookie_not_cart_table(self):
+        response = self.client.post('/add_cart/2', {'id': self.listing.id})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Cart.objects.count(), 2)
+        self.assertIn('cart', response.cookies)
+
+    def test_guest_cart_page(self):
+        self.client.post('/add_cart/2', {'id': self.listing.id})
+        self.client.post('/increase_cart_quantity/2', {'id': self.listing.id})
+        response = self.client.get('/cart/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['cart']), 1)
+        self.assertEqual(response.context['cart'][0].quantity, 2)
+        self.assertEqual(response.context['subtotal'], 39.98)
+
+    def test_bad_listing_ids_are_404(self):
+        for listing_id in ['', 'abc', '²', '9' * 30]:
+            self.assertEqual(self.client.post('/add_cart/2', {'id': listing_id}).status_code, 404)
+            self.assertEqual(self.client.post('/remove_cart/2', {'id': listing_id}).status_code, 404)
+        login = self.client.login(username='testbuyer1', password='group4se')
+        self.assertEqual(self.client.post('/increase_cart_quantity/2', {'id': 'abc'}).status_code, 404)
+        self.assertEqual(self.client.post('/add_cart/2', {'id': ''}).status_code, 404)
+
+    def test_guest_increase_stops_at_available(self):
+        self.client.post('/add_cart/2', {'id': self.listing.id})
+        self.client.post('/increase_cart_quantity/2', {'id': self.listing.id})
+        self.client.post('/increase_cart_quantity/2', {'id': self.listing.id})
+        response = self.client.get('/cart/')
+        self.assertEqual(response.context['cart'][0].quantity, 2)
+
+    def test_guest_decrease_and_remove(self):
+        self.client.post('/add_cart/2', {'id': self.listing.id})
+        with self.assertNumQueries(0):
+            self.client.post('/decrease_cart_quantity/2', {'id': self.listing.id})
+        response = self.client.get('/cart/')
+        self.assertEqual(len(response.context['cart']), 0)
+
+    def test_guest_invalid_listing(self):
+        response = self.client.post('/add_cart/100', {'id': 100})
+        self.assertEqual(response.status_code, 404)
+
+    def test_login_merges_cookie_cart(self):
+        self.client.post('/add_cart/2', {'id': self.listing.id})
+        self.client.post('/increase_cart_quantity/2', {'id': self.listing.id})
+        CustomUser.objects.create_user(username='testbuyer2', password='group4se', type="Buyer")
+        response = self.client.post('/accounts/login/', {'username': 'testbuyer2', 'password': 'group4se'})
+        item = Cart.objects.get(userID__username='testbuyer2')
+        self.assertEqual(item.quantity, 2)
+        self.assertEqual(item.reserved, 2)
+        self.assertEqual(response.cookies['cart'].value, '')
+
 class SellerDashboardViewTest(TestCase):
     def setUp(self):
         populateDB()
@@ -636,6 +1080,329 @@ class SellerDashboardViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.context['listing_list']), 2)
 
+class SellerStatsViewTest(TestCase):
+    def setUp(self):
+        populateDB()
+        self.buyer = CustomUser.objects.get(username='testbuyer1')
+        self.seller = CustomUser.objects.get(username='testseller1')
+        self.listing = Listing.objects.get(listingID=2)
+        for quantity, delivered in [(1, False), (2, False), (3, True)]:
+            Order.objects.create(date='2024-04-16', oldListingId=self.listing.id, quantity=quantity, book=self.listing.isbn,
+                price=10, buyer=self.buyer, seller=self.seller, delivered=delivered, address='1 St', payment='1234123412341234')
+        call_command('rebuild_seller_stats', stdout=StringIO())
+
+    def test_dashboard_counts_undelivered(self):
+        login = self.client.login(username='testseller1', password='group4se')
+        response = self.client.get('/seller/')
+        self.assertEqual(response.context['undelivered_count'], 2)
+        self.assertEqual(response.context['stats']['units'], 6)
+
+    def test_seller_orders_total(self):
+        login = self.client.login(username='testseller1', password='group4se')
+        response = self.client.get('/seller_orders/')
+        self.assertEqual(response.context['total_made'], 60)
+
+    def test_returns_leave_revenue(self):
+        order = Order.objects.get(quantity=2)
+        login = self.client.login(username='testbuyer1', password='group4se')
+        self.client.post('/return_order/' + str(order.id))
+        self.assertTrue(Order.objects.get(id=order.id).returned)
+        self.assertEqual(Listing.objects.get(id=self.listing.id).quantity, 4)
+
+        self.client.logout()
+        login = self.client.login(username='testseller1', password='group4se')
+        response = self.client.get('/seller_orders/')
+        self.assertEqual(response.context['stats'], {'revenue': 40, 'units': 4, 'undelivered': 1, 'returns': 1})
+
+    def test_dashboard_query_count_does_not_grow_with_orders(self):
+        login = self.client.login(username='testseller1', password='group4se')
+        with self.assertNumQueries(5):
+            self.client.get('/seller/')
+        for number in range(10):
+            Order.objects.create(date='2024-04-16', oldListingId=self.listing.id, quantity=1, book=self.listing.isbn,
+                price=10, buyer=self.buyer, seller=self.seller, address='1 St', payment='1234123412341234')
+        #the catalog counts now come from the cache
+        with self.assertNumQueries(4):
+            self.client.get('/seller/')
+
+    def test_checkout_and_delivery_update_ledger(self):
+        login = self.client.login(username='testbuyer1', password='group4se')
+        self.client.post('/checkout/', {'checkout': True, 'address': '1234 Example st', 'paymentType': 'Visa', 'cardNum': '1234123412341234', 'CVV': '123', 'Expiration': '12/24'})
+        self.client.logout()
+        login = self.client.login(username='testseller1', password='group4se')
+        response = self.client.get('/seller_orders/')
+        #the cart had one copy each of listings 1 and 2, both from this seller
+        self.assertEqual(response.context['stats'], {'revenue': 104.98, 'units': 8, 'undelivered': 4, 'returns': 0})
+        self.assertEqual(response.context['daily_stats'][0].date, datetime.date.today())
+
+        order = Order.objects.get(price=19.99)
+        self.client.post('/deliver_order/' + str(order.id))
+        self.client.post('/deliver_order/' + str(order.id))
+        self.assertEqual(self.client.get('/seller_orders/').context['stats']['undelivered'], 3)
+
+    def test_rebuild_matches_ledger(self):
+        order = Order.objects.get(quantity=2)
+        login = self.client.login(username='testbuyer1', password='group4se')
+        self.client.post('/return_order/' + str(order.id))
+        self.client.post('/return_order/' + str(order.id))
+        kept = {row['seller_id']: row for row in SellerStats.objects.values()}
+        days = list(SellerDailyStats.objects.order_by('seller', 'date').values('seller', 'date', 'revenue', 'units', 'returns'))
+
+        call_command('rebuild_seller_stats', stdout=StringIO())
+        self.assertEqual({row['seller_id']: row for row in SellerStats.objects.values()}, kept)
+        self.assertEqual(list(SellerDailyStats.objects.order_by('seller', 'date').values('seller', 'date', 'revenue', 'units', 'returns')), days)
+        self.assertEqual(kept[self.seller.id]['returns'], 1)
+
+    def test_rebuild_in_small_batches(self):
+        days = list(SellerDailyStats.objects.order_by('seller', 'date').values('seller', 'date', 'revenue', 'units', 'returns'))
+        out = StringIO()
+        call_command('rebuild_seller_stats', '--batch-size', '1', stdout=out)
+        self.assertEqual(list(SellerDailyStats.objects.order_by('seller', 'date').values('seller', 'date', 'revenue', 'units', 'returns')), days)
+        self.assertIn('%d days' % len(days), out.getvalue())
+
+class OrderHistoryViewTest(TestCase):
+    def setUp(self):
+        populateDB()
+        self.buyer = CustomUser.objects.get(username='testbuyer1')
+        self.seller = CustomUser.objects.get(username='testseller1')
+        self.listing = Listing.objects.get(listingID=2)
+        for day in range(1, 8):
+            Order.objects.create(date=datetime.date(2024, 4, day), oldListingId=self.listing.id, quantity=1, book=self.listing.isbn,
+                price=10, buyer=self.buyer, seller=self.seller, delivered=day % 2 == 0, address='1 St', payment='1234123412341234')
+
+    def test_buyer_orders_pages_newest_first(self):
+        login = self.client.login(username='testbuyer1', password='group4se')
+        response = self.client.get('/buyer_orders/?size=3')
+        self.assertEqual([order.date.day for order in response.context['orders_list']], [7, 6, 5])
+        response = self.client.get('/buyer_orders/?size=3&after=' + response.context['page'].next_cursor)
+        self.assertEqual([order.date.day for order in response.context['orders_list']], [4, 3, 2])
+        response = self.client.get('/buyer_orders/?size=3&before=' + response.context['page'].prev_cursor)
+        self.assertEqual([order.date.day for order in response.context['orders_list']], [7, 6, 5])
+
+    def test_tampered_cursor_starts_over(self):
+        login = self.client.login(username='testbuyer1', password='group4se')
+        for values in [['2024-99-99', 1], ['2024-04-05', 'x'], ['2024-04-05', 10 ** 30], [['2024-04-05'], 1]]:
+            response = self.client.get('/buyer_orders/?size=3&after=' + encode_cursor(values))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([order.date.day for order in response.context['orders_list']], [7, 6, 5])
+
+    def test_seller_orders_filters(self):
+        login = self.client.login(username='testseller1', password='group4se')
+        response = self.client.get('/seller_orders/?status=delivered&start=2024-04-03&end=2024-04-06')
+        self.assertEqual([order.date.day for order in response.context['orders_list']], [6, 4])
+        self.assertIn('status=delivered', response.context['filter_query'])
+
+    def test_seller_orders_export_streams_filtered_rows(self):
+        login = self.client.login(username='testseller1', password='group4se')
+        response = self.client.get('/seller_orders/export?status=delivered&format=csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,date,book,book__title,quantity,price,buyer__username,address,delivered,returned')
+        self.assertEqual([line.split(',')[1] for line in lines[1:]], ['2024-04-06', '2024-04-04', '2024-04-02'])
+        self.assertNotIn('1234123412341234', ''.join(lines))
+
+        response = self.client.get('/seller_orders/export?format=jsonl')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows[0]['buyer__username'], 'testbuyer1')
+
+    def test_bad_filter_is_ignored(self):
+        login = self.client.login(username='testseller1', password='group4se')
+        response = self.client.get('/seller_orders/?start=yesterday')
+        self.assertEqual(len(response.context['orders_list']), 7)
+
+    def test_query_count_does_not_grow_with_history(self):
+        login = self.client.login(username='testseller1', password='group4se')
+        with self.assertNumQueries(5):
+            self.client.get('/seller_orders/?size=3')
+        for day in range(1, 20):
+            Order.objects.create(date=datetime.date(2024, 5, day), oldListingId=self.listing.id, quantity=1, book=self.listing.isbn,
+                price=10, buyer=self.buyer, seller=self.seller, address='1 St', payment='1234123412341234')
+        with self.assertNumQueries(5):
+            self.client.get('/seller_orders/?size=3')
+
+class BulkOrderViewTest(TestCase):
+    def setUp(self):
+        populateDB()
+        self.buyer = CustomUser.objects.get(username='testbuyer1')
+        self.seller = CustomUser.objects.get(username='testseller1')
+        self.listing = Listing.objects.get(listingID=2)
+        self.orders = [
+            Order.objects.create(date='2024-04-16', oldListingId=self.listing.id, quantity=quantity, book=self.listing.isbn,
+                price=10, buyer=self.buyer, seller=self.seller, address='1 St', payment='1234123412341234').id
+            for quantity in [1, 2, 3]
+        ]
+        call_command('rebuild_seller_stats', stdout=StringIO())
+
+    def test_bulk_deliver(self):
+        login = self.client.login(username='testseller1', password='group4se')
+        with self.assertNumQueries(8):
+            response = self.client.post('/deliver_orders/', {'orders': self.orders[:2] + ['junk']})
+        self.assertRedirects(response, '/seller_orders/')
+        self.assertEqual(Order.objects.filter(delivered=True).count(), 2)
+        self.assertEqual(SellerStats.objects.get(seller=self.seller).undelivered, 1)
+
+    def test_bulk_deliver_ignores_other_sellers_orders(self):
+        CustomUser.objects.create_user(username='testseller2', password='group4se', type="Seller")
+        login = self.client.login(username='testseller2', password='group4se')
+        self.assertTrue(login)
+        self.client.post('/deliver_orders/', {'orders': self.orders})
+        self.assertEqual(Order.objects.filter(delivered=True).count(), 0)
+
+    def test_bulk_return_restocks_listings(self):
+        #a second order for a listing that has since sold out and been deleted
+        gone = Order.objects.create(date='2024-04-16', oldListingId=999, quantity=4, book=self.listing.isbn,
+            price=5, buyer=self.buyer, seller=self.seller, address='1 St', payment='1234123412341234')
+        login = self.client.login(username='testbuyer1', password='group4se')
+        self.client.post('/return_orders/', {'orders': self.orders[1:] + [gone.id]})
+        self.client.post('/return_orders/', {'orders': self.orders[1:] + [gone.id]})
+        self.assertEqual(Order.objects.filter(returned=True).count(), 3)
+        self.assertEqual(Listing.objects.get(id=self.listing.id).quantity, 7)
+        self.assertEqual(Listing.objects.get(id=999).quantity, 4)
+        self.assertEqual(SellerStats.objects.get(seller=self.seller).returns, 3)
+
+class BulkListingViewTest(TestCase):
+    def setUp(self):
+        populateDB()
+        cache.clear()
+        self.client.login(username='testseller1', password='group4se')
+
+    def upload(self, text):
+        return self.client.post('/seller/bulk_listings', {'file': SimpleUploadedFile('listings.csv', text.encode())})
+
+    def test_upload_creates_listings_and_reports_rows(self):
+        before = Listing.objects.count()
+        rows = "".join("200,%d,9.99\n" % (n % 99 + 1) for n in range(100))
+        #session and user, then one book lookup, the insert and the catalog count (plus the savepoint)
+        with self.assertNumQueries(7):
+            response = self.upload("isbn,quantity,price\n" + rows + "999,1,5\n400,0,5\n")
+        self.assertEqual(Listing.objects.count(), before + 100)
+        self.assertEqual(CatalogStats.objects.get(id=1).listings, before + 100)
+        self.assertEqual(response.context['created'], 100)
+        results = response.context['results']
+        self.assertEqual([result.line for result in results[-2:]], [102, 103])
+        self.assertIn("No book with this isbn", results[-2].errors[0])
+        self.assertTrue(results[-1].errors[0].startswith("quantity"))
+        self.assertEqual(Listing.objects.get(id=results[0].listing_id).userID.username, 'testseller1')
+
+    def test_upload_needs_the_columns(self):
+        response = self.upload("isbn,price\n200,9.99\n")
+        self.assertIn("missing quantity", response.context['form'].errors['file'][0])
+
+    def test_upload_row_limit(self):
+        with self.settings(BULK_LISTING_MAX_ROWS=2):
+            response = self.upload("isbn,quantity,price\n200,1,1\n200,1,1\n200,1,1\n")
+        self.assertIn("At most 2 rows", response.context['form'].errors['file'][0])
+
+class CatalogCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        populateDB()
+
+    def test_browse_books_served_from_cache(self):
+        self.client.get('/browse-books/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/browse-books/')
+        self.assertEqual(len(response.context['book_list']), 2)
+        self.assertEqual(caching.stats()['hits'], 1)
+
+    def test_bad_cursors_share_the_first_page_entry(self):
+        self.client.get('/browse-books/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/browse-books/?after=junk&before=' + encode_cursor(['Book 1']))
+        self.assertEqual(len(response.context['book_list']), 2)
+
+    def test_every_token_gets_a_stamp(self):
+        builds = []
+        caching.cached('test', [], ['books'], lambda: builds.append(1))
+        #a token that goes missing later (evicted, or a cache restart) must not still count as a match
+        cache.delete(caching._token_key('books'))
+        caching.cached('test', [], ['books'], lambda: builds.append(1))
+        caching.cached('test', [], ['books'], lambda: builds.append(1))
+        self.assertEqual(len(builds), 2)
+
+    def test_value_changed_while_building_is_not_kept(self):
+        builds = []
+        def build():
+            builds.append(1)
+            #the listing the page is about to show changes under it
+            caching.touch_listings([1])
+        caching.cached('test', [], [], build, lambda value: ['listing:1'])
+        caching.cached('test', [], [], lambda: builds.append(1), lambda value: ['listing:1'])
+        caching.cached('test', [], [], lambda: builds.append(1), lambda value: ['listing:1'])
+        self.assertEqual(len(builds), 2)
+
+    def test_counts_from_many_threads_add_up(self):
+        with tempfile.TemporaryDirectory() as location:
+            file_cache = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}}
+            with override_settings(CACHES=file_cache):
+                threads = [threading.Thread(target=lambda: [caching._count(caching.HITS) for number in range(25)]) for number in range(4)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                self.assertEqual(caching.stats()['hits'], 100)
+
+    def test_new_book_invalidates_browse_books(self):
+        self.client.get('/browse-books/')
+        Book.objects.create(title='Book 300', author='Author 5', isbn=300, pages=10, rating=3)
+        response = self.client.get('/browse-books/')
+        self.assertEqual(len(response.context['book_list']), 3)
+
+    def test_cart_hold_invalidates_book_page(self):
+        self.client.login(username='testbuyer1', password='group4se')
+        Cart.objects.all().delete()
+        listing = Listing.objects.get(listingID=2)
+        self.client.get('/books/200/')
+        self.client.post('/add_cart/' + str(listing.id), {'id': listing.id})
+        response = self.client.get('/books/200/')
+        self.assertEqual([item.available() for item in response.context['listing_list'] if item.id == listing.id], [1])
+
+    def test_missing_book_cached_until_created(self):
+        self.client.get('/books/300/')
+        Book.objects.create(title='Book 300', author='Author 5', isbn=300, pages=10, rating=3)
+        response = self.client.get('/books/300/')
+        self.assertEqual(response.context['book'].title, 'Book 300')
+
+    def test_author_page_follows_books(self):
+        self.client.login(username='testbuyer1', password='group4se')
+        self.client.get('/authors/author-4/')
+        Book.objects.create(title='Book 300', author='Author 4', isbn=300, pages=10, rating=3)
+        response = self.client.get('/authors/author-4/')
+        self.assertEqual(len(response.context['book_list']), 3)
+
+    def test_listing_cards_cached_by_version(self):
+        listing = Listing.objects.get(listingID=2)
+        self.client.get('/books/200/')
+        self.assertIsNotNone(cache.get(make_template_fragment_key('listing_card', [listing.id, listing.version])))
+
+        listing.price = 9.99
+        listing.save()
+        self.assertEqual(Listing.objects.get(id=listing.id).version, listing.version)
+        self.assertContains(self.client.get('/books/200/'), '$9.99')
+
+    def test_stock_updates_bump_version(self):
+        listing = Listing.objects.get(listingID=2)
+        reserve(listing.id, 1)
+        self.assertEqual(Listing.objects.get(id=listing.id).version, listing.version + 1)
+
+    def test_edit_after_reserve_gets_a_new_version(self):
+        listing = Listing.objects.get(listingID=2)
+        reserve(listing.id, 1)
+        reserved_version = Listing.objects.get(id=listing.id).version
+        #the copy loaded before the hold still has the old version
+        listing.price = 9.99
+        listing.save(update_fields=['price'])
+        self.assertEqual(listing.version, reserved_version + 1)
+        self.assertEqual(Listing.objects.get(id=listing.id).version, reserved_version + 1)
+        self.assertContains(self.client.get('/books/200/'), '$9.99')
+
+    def test_cache_stats_is_staff_only(self):
+        self.client.login(username='testbuyer1', password='group4se')
+        self.assertEqual(self.client.get('/cache_stats/').status_code, 302)
+        CustomUser.objects.filter(username='testbuyer1').update(is_staff=True)
+        self.assertIn('hit_rate', self.client.get('/cache_stats/').json())
+
 class AddBookViewTest(TestCase):
     def setUp(self):
         populateDB()
@@ -645,7 +1412,7 @@ class AddBookViewTest(TestCase):
         data = {
             "title":"Huckleberry Finn",
             "author":"Mark Twain",
-            "isbn":"7364590382738",
+            "isbn":"9780306406157",
             "pages":"362",
             "rating":"4.5"
             }
@@ -659,7 +1426,7 @@ class AddBookViewTest(TestCase):
         data = {
             "title":"Huckleberry Finn",
             "author":"Mark Twain",
-            "isbn":"7364590382738",
+            "isbn":"9780306406157",
             "pages":"362",
             "rating":"4.5"
             }
@@ -674,6 +1441,24 @@ class SellerListingViewTest(TestCase):
     def setUp(self):
        populateDB()
 
+    def test_edit_keeps_holds(self):
+        listing = Listing.objects.get(listingID=2)
+        reserve(listing.id, 2)
+        login = self.client.login(username='testseller1', password='group4se')
+        response = self.client.post('/edit_listing/' + str(listing.id), {'isbn': listing.isbn_id, 'quantity': 5, 'price': 5})
+        self.assertEqual(response.status_code, 302)
+        listing = Listing.objects.get(id=listing.id)
+        self.assertEqual((listing.quantity, listing.price, listing.reserved), (5, 5, 2))
+
+    def test_edit_cannot_go_below_held_copies(self):
+        listing = Listing.objects.get(listingID=2)
+        reserve(listing.id, 2)
+        login = self.client.login(username='testseller1', password='group4se')
+        response = self.client.post('/edit_listing/' + str(listing.id), {'isbn': listing.isbn_id, 'quantity': 1, 'price': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('quantity', response.context['form'].errors)
+        self.assertEqual(Listing.objects.get(id=listing.id).quantity, 2)
+
     def test_view_url_redirects(self):
         login = self.client.login(username='testseller1', password='group4se')
         response = self.client.get('/seller/listings/1')
@@ -0,0 +1,127 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db.models import F
+from PIL import Image as PILImage, ImageOps
+
+from .models import Image, Listing
+from . import caching, jobs
+
+
+'''
+Thumbnails for uploaded listing images.
+
+Sellers upload phone photos that are often several MB, but the cards only
+show them 115px wide. Every upload gets WebP and JPEG copies at
+THUMBNAIL_WIDTHS, saved next to the original under thumbs/. The templates
+pick one through srcset (see templatetags/images.py). The copies are
+re-encoded from the pixels only, so EXIF data (camera, GPS) is not carried
+over; the orientation tag is applied first so rotated photos come out the
+right way up. The original is re-saved the same way, in place, since pages
+fall back to it when there are no thumbnails. (Image.sha256 stays the hash
+of the bytes as uploaded, so the same upload still finds it.)
+
+Making them takes a while for a big photo, so uploads only queue a
+'thumbnails' job (see jobs.py) and the run_jobs worker does it. Until then
+Image.pending is set and the pages show a placeholder.
+'''
+
+THUMBNAIL_DIR = 'thumbs'
+FORMATS = {
+    'webp': ('WEBP', {'method': 6}),
+    'jpeg': ('JPEG', {'optimize': True, 'progressive': True}),
+}
+#how the original is written back without its metadata, by the format it was uploaded in
+ORIGINAL_FORMATS = {
+    'JPEG': {'quality': 95},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': 95},
+}
+
+
+def _open(image):
+    #the upright picture and the format it came in
+    image.image.open('rb')
+    try:
+        with PILImage.open(image.image) as source:
+            #apply the EXIF rotation before it gets dropped
+            upright = ImageOps.exif_transpose(source)
+            upright.load()
+            return upright, source.format
+    finally:
+        image.image.close()
+
+def strip_original(image, source, pil_format):
+    '''Writes the uploaded file back from its pixels only, so no EXIF (GPS, camera) or other metadata is served.'''
+    options = ORIGINAL_FORMATS.get(pil_format)
+    if options is None:
+        return
+    #keep only what is part of the picture itself
+    source.info = {key: value for key, value in source.info.items() if key == 'transparency'}
+    buffer = BytesIO()
+    source.save(buffer, format=pil_format, **options)
+    storage = image.image.storage
+    name = image.image.name
+    storage.delete(name)
+    saved = storage.save(name, ContentFile(buffer.getvalue()))
+    if saved != name:
+        Image.objects.filter(pk=image.pk).update(image=saved)
+        image.image.name = saved
+
+def _widths(source_width):
+    #no upscaling, a small upload just gets one copy at its own width
+    widths = [width for width in settings.THUMBNAIL_WIDTHS if width < source_width]
+    if len(widths) < len(settings.THUMBNAIL_WIDTHS):
+        widths.append(source_width)
+    return widths
+
+def make_thumbnails(image):
+    '''Makes and saves the thumbnails for one Image; returns its variants (empty if the file can't be read).'''
+    try:
+        source, pil_format = _open(image)
+    except (OSError, ValueError):
+        return {}
+    strip_original(image, source, pil_format)
+    source = source.convert('RGB')
+
+    storage = image.image.storage
+    stem = os.path.splitext(os.path.basename(image.image.name))[0]
+    variants = {}
+    for width in _widths(source.width):
+        resized = source.resize((width, max(1, round(source.height * width / source.width))), PILImage.LANCZOS)
+        for name, (pil_format, options) in FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, format=pil_format, quality=settings.THUMBNAIL_QUALITY, **options)
+            path = storage.save('%s/%s-%d.%s' % (THUMBNAIL_DIR, stem, width, name), ContentFile(buffer.getvalue()))
+            variants.setdefault(name, []).append([resized.width, resized.height, path])
+
+    remove_thumbnails(image)
+    #update() rather than save() so the post_save signal doesn't run again
+    Image.objects.filter(pk=image.pk).update(variants=variants)
+    image.variants = variants
+    return variants
+
+def remove_thumbnails(image):
+    for variants in image.variants.values():
+        for width, height, path in variants:
+            image.image.storage.delete(path)
+
+
+def image_ready(image_id):
+    #stop showing the placeholder, and rebuild the cached listing cards that showed it
+    Image.objects.filter(id=image_id).update(pending=False)
+    listing_ids = list(Listing.objects.filter(image_id=image_id).values_list('id', flat=True))
+    Listing.objects.filter(id__in=listing_ids).update(version=F('version') + 1)
+    caching.touch_listings(listing_ids)
+
+@jobs.handler('thumbnails', on_failure=image_ready)
+def thumbnail_job(image_id):
+    image = Image.objects.filter(id=image_id).first()
+    if image is None:
+        #deleted before we got to it
+        return
+    #an unreadable file gets no thumbnails but is still ready, the pages fall back to the original
+    make_thumbnails(image)
+    image_ready(image_id)
@@ -1,10 +1,32 @@
+import csv
+import io
+import itertools
+
 from django.shortcuts import render, redirect, get_object_or_404
-from .models import Book, Listing, Cart, Order, Image
+from django.http import Http404, JsonResponse, QueryDict, StreamingHttpResponse
+from django.conf import settings
+from django.urls import reverse
+from django.db import transaction
+from django.db.models import F, Sum, FloatField, ExpressionWrapper, Window
+from .models import Book, Author, Listing, Cart, Order, Image
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import login
-from .forms import SignupForm, ListingForm, BookForm, CheckoutForm
+from django.contrib import messages
+from .forms import SignupForm, ListingForm, BookForm, CheckoutForm, OrderFilterForm, BulkListingForm
+from .pagination import clean_cursor, keyset_paginate, get_page_size
+from .search import search_books
+from .isbn import isbn_key
+from .checkout import checkout_cart, OutOfStock
+from .reservations import add_to_cart, change_cart_quantity, remove_from_cart
+from .stats import seller_stats, recent_daily_stats, catalog_stats
+from .fulfillment import deliver_orders, return_orders
+from .bulk_listings import read_rows, create_listings, CREATED
+from .exports import export_lines, FORMATS, SELLER_ORDER_FIELDS
+from . import session_cart
+from . import autocomplete as typeahead
+from . import caching
 from django.core.exceptions import ObjectDoesNotExist
-import datetime
 
 
 def signup(request):
@@ -20,13 +42,6 @@ def signup(request):
 
 @login_required
 def router(request):
-    num_books = Book.objects.all().count()
-
-    context = {
-        'num_books': num_books,
-        'user_type': request.user.type,
-    }
-
     if (request.user.type == "Buyer"):
         return redirect('buyer_dashboard')
     
@@ -38,10 +53,11 @@ def router(request):
     
 @login_required
 def buyer_dashboard(request):
-    num_books = Book.objects.all().count()
+    catalog = catalog_stats()
 
     context = {
-        'num_books': num_books,
+        'num_books': catalog['books'],
+        'catalog': catalog,
         'user_type': request.user.type,
     }
 
@@ -49,92 +65,192 @@ def buyer_dashboard(request):
 
 @login_required
 def seller_dashboard(request):
-    num_books = Book.objects.all().count()
-    listings_list = Listing.objects.filter(userID=request.user.id)
+    catalog = catalog_stats()
+    listings_list = Listing.objects.filter(userID=request.user.id).select_related('isbn')
 
     #notify if a new listing has sold
-    orders_list = Order.objects.filter(seller=request.user)
-    undelivered_count = 0
-    for order in orders_list:
-        if not order.delivered:
-            undelivered_count += 1
+    stats = seller_stats(request.user)
 
     context = {
-        'num_books': num_books,
+        'num_books': catalog['books'],
+        'catalog': catalog,
         'user_type': request.user.type,
         'listing_list': listings_list,
-        'undelivered_count': undelivered_count
+        'undelivered_count': stats['undelivered'],
+        'stats': stats,
     }
 
     return render(request, 'seller_dashboard.html', context=context)
 
-@login_required
+AUTHOR_LETTERS = [chr(code) for code in range(ord('A'), ord('Z') + 1)] + ['#']
+
 def browse_books(request):
-    book_list = Book.objects.all().order_by('title').values()
+    #one page at a time, seeking on (title, isbn) so deep pages are as cheap as the first
+    books = Book.objects.values('isbn', 'title', 'author')
+    ordering = ['title', 'isbn']
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    size = get_page_size(request)
+    #keyed on the decoded cursors, so junk in the query string can't fill the cache with copies of page 1
+    params = [clean_cursor(books, ordering, after), clean_cursor(books, ordering, before), size]
+    page = caching.cached('browse_books', params, ['books'], lambda: keyset_paginate(
+        books,
+        ordering,
+        size,
+        after=after,
+        before=before,
+    ))
     context = {
-        "book_list" : book_list,
+        "book_list" : page.items,
+        "page": page,
     }
     return render(request, 'browse_books.html', context = context)
 
+@login_required
 def browse_authors(request):
-    authors = []
-    temp_authors = Book.objects.order_by('author').values("author")
-    for value in temp_authors:
-        if value not in authors:
-            authors.append(value)
+    #read straight from the Author summary table, one row per author
+    authors = Author.objects.values('slug', 'book_count', 'average_rating', author=F('name'))
+
+    letter = request.GET.get('letter', '').upper()
+    if letter in AUTHOR_LETTERS:
+        authors = authors.filter(letter=letter)
+    else:
+        letter = ''
+
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    size = get_page_size(request)
+    params = [letter, clean_cursor(authors, ['author'], after), clean_cursor(authors, ['author'], before), size]
+    page = caching.cached('browse_authors', params, ['authors'], lambda: keyset_paginate(
+        authors,
+        ['author'],
+        size,
+        after=after,
+        before=before,
+    ))
     context = {
-        'authors': authors,
+        'authors': page.items,
+        'page': page,
+        'letters': AUTHOR_LETTERS,
+        'letter': letter,
     }
     return render(request, 'browse_authors.html', context = context)
 
-@login_required
+def book_page(isbn):
+    book = Book.objects.filter(isbn = isbn).first()
+    if book is None:
+        return None
+    listings_list = list(
+        Listing.objects.filter(isbn = isbn)
+        .select_related('image')
+        .annotate(seller = F('userID__username'))
+        .order_by('price')
+    )
+    return book, listings_list
+
 def book(request, isbn):
-    try:
-        book = Book.objects.get(isbn = isbn)
-        listings_list = Listing.objects.filter(isbn = isbn).order_by('price')
-    except(ObjectDoesNotExist):
+    #one address per book, so /books/0-306-40615-2/ and the 13 digit form share a cache entry
+    key = isbn_key(isbn)
+    if key != isbn:
+        return redirect('book-view', key, permanent=True)
+    #rebuilt when the book or any of its listings change (see caching.py)
+    page = caching.cached('book', [isbn], ['book:%s' % isbn], lambda: book_page(isbn),
+                          lambda page: ['listing:%s' % listing.id for listing in page[1]] if page else [])
+    if page is None:
         return render(request, "null_book.html")
     
     context = {
-        "book": book,
-        "listing_list": listings_list,
+        "book": page[0],
+        "listing_list": page[1],
+        "card_timeout": settings.CATALOG_CACHE_TIMEOUT,
             }
 
     return render(request, 'book.html', context = context)
 
 
-@login_required
+def posted_listing_id(request):
+    #the id a cart button posts; anything else (empty, letters, too big for the column) is a 404, not a 500
+    key = request.POST.get('id', '').strip()
+    if not (key.isascii() and key.isdigit()) or len(key) > 18:
+        raise Http404("No such listing")
+    return int(key)
+
+def cart_item_or_404(request):
+    #the (user, listing) unique index makes this a single lookup
+    listing_id = posted_listing_id(request)
+    item = Cart.objects.filter(userID=request.user, listingID=listing_id).first()
+    if item is None:
+        #404 for listings that don't exist, otherwise it just isn't in the cart
+        get_object_or_404(Listing, id=listing_id)
+    return item
+
+def guest_cart_click(request, action):
+    '''
+    Cart clicks ('add', 'increase', 'decrease' or 'remove') for visitors who aren't
+    logged in, kept in the cart cookie (see session_cart.py). The Cart table is never touched.
+    '''
+    cart = session_cart.read(request)
+    key = str(posted_listing_id(request))
+
+    if key in cart and action == 'decrease' and cart[key] > 1:
+        cart[key] -= 1
+    elif key in cart and action in ('decrease', 'remove'):
+        del cart[key]
+    elif key not in cart or action == 'increase':
+        #404 for listings that don't exist, and only offer copies that aren't held
+        listing = get_object_or_404(Listing.objects.only('id', 'quantity', 'reserved'), id=key)
+        if action == 'increase' and key in cart:
+            if listing.available() >= cart[key] + 1:
+                cart[key] += 1
+        elif action == 'add':
+            if len(cart) >= settings.CART_COOKIE_MAX_ITEMS:
+                messages.error(request, "Your cart is full, log in to add more")
+            elif listing.available() < 1:
+                messages.error(request, "Every copy of that listing is in someone else's cart right now")
+            else:
+                cart[str(listing.id)] = 1
+
+    return session_cart.write(redirect('cart'), cart)
+
 def add_cart(request, id):
-    listing = get_object_or_404(Listing, id=request.POST.get('id'))
-    cart = Cart.objects.filter(userID=request.user.username).values('listingID')
-    cartlistings = Listing.objects.filter(id__in=cart)
+    if not request.user.is_authenticated:
+        return guest_cart_click(request, 'add')
 
-    if listing in cartlistings:
-        return redirect('cart')
-    else:
-        p = Cart.objects.create(listingID=listing, quantity=1, userID=request.user.username)
-        return redirect('cart')
+    listing = get_object_or_404(Listing.objects.only('id'), id=posted_listing_id(request))
+
+    #holds the copy for the buyer, fails if every copy is in someone's cart
+    if not add_to_cart(request.user, listing.id):
+        messages.error(request, "Every copy of that listing is in someone else's cart right now")
+    return redirect('cart')
 
-@login_required
 def remove_cart(request, id):
-    listing = get_object_or_404(Listing, id=request.POST.get('id'))
-    cart = Cart.objects.filter(userID=request.user.username).values('listingID')
-    cartlisting = Listing.objects.filter(id__in=cart)
+    if not request.user.is_authenticated:
+        return guest_cart_click(request, 'remove')
 
-    if listing in cartlisting:
-        p = Cart.objects.filter(listingID=listing, userID=request.user.username).delete()
-        return redirect('cart')
-    else:
-        return redirect('cart')
+    item = cart_item_or_404(request)
+    if item is not None:
+        remove_from_cart(item)
+    return redirect('cart')
 
-@login_required
 def pull_cart(request):
-        cart = Cart.objects.filter(userID=request.user.username)
-        listings = Listing.objects.filter(id__in=cart).values('isbn')
-        books = Book.objects.filter(isbn__in=listings)
-    
-        return render(request, "cart_display.html",
-                      {'books': books,'listings': listings ,'username': request.user.username, 'cart': cart})
+    if not request.user.is_authenticated:
+        cart = session_cart.items(session_cart.read(request))
+        subtotal = sum(item.line_total for item in cart)
+        return render(request, "cart_display.html", {'username': 'Guest', 'cart': cart, 'subtotal': round(subtotal, 2)})
+
+    #one query: the listing, book and image come along with each cart row and
+    #the db works out every line total plus the cart subtotal (a window over all rows)
+    line_total = ExpressionWrapper(F('quantity') * F('listingID__price'), output_field=FloatField())
+    cart = list(
+        Cart.objects.filter(userID=request.user)
+        .select_related('listingID__isbn', 'listingID__image')
+        .annotate(line_total=line_total, cart_subtotal=Window(expression=Sum(line_total)))
+        .order_by('id')
+    )
+    subtotal = cart[0].cart_subtotal if cart else 0
+
+    return render(request, "cart_display.html",
+                  {'username': request.user.username, 'cart': cart, 'subtotal': round(subtotal, 2)})
 
 
 @login_required
@@ -142,38 +258,13 @@ def checkout(request):
     if 'checkout' in request.POST:
         form = CheckoutForm(request.POST)
 
-        #data would need to be verified and used here once changes to models are implemented
-
         if form.is_valid():
-            cart = Cart.objects.filter(userID=request.user.username)
-
-            for item in cart:
-                listing = item.listingID
-
-                #create an order
-                new_order = Order(
-                    date = datetime.date.today(),
-                    quantity = item.quantity,
-                    book = listing.isbn,
-                    price = listing.price,
-                    buyer = request.user,
-                    seller = listing.userID,
-                    delivered = False,
-                    address = form.cleaned_data['address'],
-                    payment = form.cleaned_data['cardNum'],
-                    oldListingId = listing.id,
-                    oldListingImage = listing.image
-                )
-                new_order.save()
-
-                #decrease listing amount by the cart items amount
-                if item.quantity < listing.quantity:
-                    listing.quantity -= item.quantity
-                    listing.save()
-                else:
-                    listing.delete()
-
-            Cart.objects.filter(userID=request.user.username).delete()
+            try:
+                checkout_cart(request.user, form.cleaned_data['address'], form.cleaned_data['cardNum'])
+            except OutOfStock as error:
+                #nothing was bought, tell them which items are the problem
+                for failure in error.failures:
+                    messages.error(request, failure)
 
             return redirect('cart')
         else:
@@ -185,39 +276,87 @@ def checkout(request):
     
 @login_required
 def author(request, author):
-    books = Book.objects.filter(author = author)
-    if(len(books) == 0):
+    return render_author(request, 'name', author)
+
+@login_required
+def author_by_slug(request, slug):
+    return render_author(request, 'slug', slug)
+
+def author_page(field, value):
+    summary = Author.objects.filter(**{field: value}).first()
+    if summary is None:
+        return None
+    return summary, list(Book.objects.filter(author = summary.name).order_by('title', 'isbn'))
+
+def render_author(request, field, value):
+    #rebuilt when that author's summary changes; a missing slug waits for any new author
+    page = caching.cached('author', [field, value], ['author:%s' % value] if field == 'name' else [],
+                          lambda: author_page(field, value),
+                          lambda page: ['author:%s' % page[0].name] if page else ['authors'])
+    if page is None:
         return render(request, "null_author.html")
 
     context = {
-        'book_list' : books,
+        'book_list' : page[1],
+        'author': page[0],
     }
 
     return render(request, 'browse_books.html', context = context)
 
 @login_required
 def search(request):
-    if request.method=="POST":
-        search = request.POST["search"]
+    #the sidebar form POSTs, the page links GET
+    search = request.POST.get("search", request.GET.get("search"))
+    if search is None:
+        return render(request, "null_search.html")
 
-        if len(search) == 0:
-            return render(request, "null_search.html", {"search": search})
+    search = search.strip()
+    if len(search) == 0:
+        return render(request, "null_search.html", {"search": search})
 
-        results = Book.objects.filter(title__contains=search)
-        results = results | Book.objects.filter(author__contains=search)
-        results = results | Book.objects.filter(isbn=search)
-        results.order_by("title", "author", "rating")
+    size = get_page_size(request)
+    #past the last page that fits in SEARCH_MAX_RESULTS shows that last page
+    last_page = max(1, -(-settings.SEARCH_MAX_RESULTS // size))
+    try:
+        page_number = min(max(1, int(request.GET.get("page", 1))), last_page)
+    except ValueError:
+        page_number = 1
 
-        if len(results) == 0:
-            return render(request, "null_search.html", {"search": search})
+    results, more = search_books(search, size, offset=(page_number - 1) * size)
 
-        context = {
-                "book_list": results,
-                }
-        return render(request, "browse_books.html", context = context)
+    if len(results) == 0:
+        return render(request, "null_search.html", {"search": search})
 
-    else:
-        return render(request, "null_search.html")
+    context = {
+            "book_list": results,
+            "search": search,
+            "search_page": {
+                "number": page_number,
+                "size": size,
+                "previous": page_number - 1 if page_number > 1 else None,
+                "next": page_number + 1 if more and page_number < last_page else None,
+            },
+            }
+    return render(request, "browse_books.html", context = context)
+
+def autocomplete(request):
+    #open to guests too, the sidebar box is on every page; answered from memory so the search box can suggest on every keystroke
+    try:
+        limit = int(request.GET.get("limit", settings.AUTOCOMPLETE_LIMIT))
+    except ValueError:
+        limit = settings.AUTOCOMPLETE_LIMIT
+    limit = max(1, min(limit, settings.AUTOCOMPLETE_MAX_LIMIT))
+
+    query = request.GET.get("q", "")
+    results = typeahead.index.suggest(query, limit)
+    for result in results:
+        if result["type"] == typeahead.TITLE:
+            result["url"] = reverse("book-view", args=[result["isbn"]])
+        else:
+            result["url"] = reverse("author-view", args=[result["label"]])
+        del result["isbn"]
+
+    return JsonResponse({"query": query, "results": results})
 
 @login_required
 def seller_listing(request, id):
@@ -245,13 +384,11 @@ def add_listing(request, isbn=''):
             # process the data in form.cleaned_data as required (here we just write it to the model due_back field)
             
             #book already exists
-            if (Book.objects.filter(isbn=form.cleaned_data['isbn'])):
-                book = Book.objects.filter(isbn=form.cleaned_data['isbn'])[0]
+            book = Book.objects.filter(isbn=form.cleaned_data['isbn']).first()
+            if book is not None:
                 if form.cleaned_data.get('image'):
-                    new_image = Image(
-                        image=form.cleaned_data.get('image')
-                    )
-                    new_image.save()
+                    #sellers often reuse one cover photo, the same bytes share one Image
+                    new_image = Image.from_upload(form.cleaned_data.get('image'))
                     new_listing = Listing(
                         listingID = 0,
                         isbn = book,
@@ -278,7 +415,7 @@ def add_listing(request, isbn=''):
 
     # If this is a GET (or any other method) create the default form.
     else:
-        form = ListingForm(initial={'isbn': isbn})
+        form = ListingForm(initial={'isbn': isbn_key(isbn) if isbn else ''})
 
     context = {
         'form': form,
@@ -286,6 +423,33 @@ def add_listing(request, isbn=''):
 
     return render(request, 'add_listing.html', context)
 
+@login_required
+def bulk_listings(request):
+    results = None
+    if request.method == 'POST':
+        form = BulkListingForm(request.POST, request.FILES)
+        if form.is_valid():
+            file = io.TextIOWrapper(form.cleaned_data['file'].file, encoding='utf-8-sig', newline='')
+            try:
+                rows = list(itertools.islice(read_rows(file), settings.BULK_LISTING_MAX_ROWS + 1))
+            except (ValueError, csv.Error) as error:
+                #UnicodeDecodeError is a ValueError too
+                form.add_error('file', str(error))
+            else:
+                if len(rows) > settings.BULK_LISTING_MAX_ROWS:
+                    form.add_error('file', "At most %d rows per upload" % settings.BULK_LISTING_MAX_ROWS)
+                else:
+                    results = sorted(create_listings(request.user, rows), key=lambda result: result.line)
+    else:
+        form = BulkListingForm()
+
+    context = {
+        'form': form,
+        'results': results,
+        'created': sum(result.status == CREATED for result in results or []),
+    }
+    return render(request, 'bulk_listings.html', context)
+
 @login_required
 def add_book(request):
      # If this is a POST request then process the Form data
@@ -329,41 +493,25 @@ def remove_listing(request,id):
     else:
         return redirect('/seller/')
     
-@login_required
 def decrease_cart_quantity(request, id):
-    listing = get_object_or_404(Listing, id=request.POST.get('id'))
-    cart = Cart.objects.filter(userID=request.user.username).values('listingID')
-    cartlisting = Listing.objects.filter(id__in=cart)
-
-    if listing in cartlisting:
-        p = Cart.objects.filter(listingID=listing, userID=request.user.username)
-        for cartObject in p:
-            if cartObject.quantity > 1:
-                cartObject.quantity -= 1
-                cartObject.save()
-            else:
-                cartObject.delete()
-        return redirect('cart')
-    else:
-        return redirect('cart')
+    if not request.user.is_authenticated:
+        return guest_cart_click(request, 'decrease')
+
+    item = cart_item_or_404(request)
+    if item is not None:
+        #dropping to 0 removes it and gives the held copy back
+        change_cart_quantity(item, -1)
+    return redirect('cart')
     
-@login_required
 def increase_cart_quantity(request, id):
-    listing = get_object_or_404(Listing, id=request.POST.get('id'))
-    cart = Cart.objects.filter(userID=request.user.username).values('listingID')
-    cartlisting = Listing.objects.filter(id__in=cart)
-
-    if listing in cartlisting:
-        p = Cart.objects.filter(listingID=listing, userID=request.user.username)
-        for cartObject in p:
-            if listing.quantity >= cartObject.quantity + 1:
-                cartObject.quantity += 1
-                cartObject.save()
-            else:
-                pass
-        return redirect('cart')
-    else:
-        return redirect('cart')
+    if not request.user.is_authenticated:
+        return guest_cart_click(request, 'increase')
+
+    item = cart_item_or_404(request)
+    if item is not None:
+        #only goes up if there is a free copy to hold
+        change_cart_quantity(item, 1)
+    return redirect('cart')
     
 @login_required
 def edit_listing(request, id):
@@ -374,17 +522,25 @@ def edit_listing(request, id):
     if request.method == 'POST':
 
         # Create a form instance and populate it with data from the request (binding):
-        form = ListingForm(request.POST)
+        form = ListingForm(request.POST, request.FILES)
 
         # Check if the form is valid:
         if form.is_valid():
-            listing.quantity=form.cleaned_data['quantity']
-            listing.price=form.cleaned_data['price']
-            listing.image=form.cleaned_data['image']
-            listing.save()
+            #locked and read again, so a hold taken since the page loaded is seen and not overwritten
+            with transaction.atomic():
+                listing = Listing.objects.select_for_update().get(id=listing.id)
+                if form.cleaned_data['quantity'] < listing.reserved:
+                    form.add_error('quantity', "%d copies are held in buyers' carts, the quantity can't go below that" % listing.reserved)
+                else:
+                    listing.quantity=form.cleaned_data['quantity']
+                    listing.price=form.cleaned_data['price']
+                    #keep the current picture unless a new one was uploaded
+                    if form.cleaned_data.get('image'):
+                        listing.image=Image.from_upload(form.cleaned_data['image'])
+                    listing.save(update_fields=['quantity', 'price', 'image'])
 
-            # redirect to a new URL:
-            return redirect('/seller')
+                    # redirect to a new URL:
+                    return redirect('/seller')
 
     # If this is a GET (or any other method) create the default form.
     else:
@@ -396,72 +552,118 @@ def edit_listing(request, id):
 
     return render(request, 'add_listing.html', context)
 
+def filter_orders(request, orders):
+    '''
+    Narrows orders by the status and date range in OrderFilterForm; returns
+    the queryset, the bound form and the filters as a query string.
+    '''
+    form = OrderFilterForm(request.GET)
+    filters = QueryDict(mutable=True)
+    if form.is_valid():
+        status = form.cleaned_data['status']
+        if status == 'undelivered':
+            orders = orders.filter(delivered=False, returned=False)
+        elif status == 'delivered':
+            orders = orders.filter(delivered=True)
+        elif status == 'returned':
+            orders = orders.filter(returned=True)
+        if form.cleaned_data['start']:
+            orders = orders.filter(date__gte=form.cleaned_data['start'])
+        if form.cleaned_data['end']:
+            orders = orders.filter(date__lte=form.cleaned_data['end'])
+        for field in ['status', 'start', 'end']:
+            if form.cleaned_data[field]:
+                filters[field] = str(form.cleaned_data[field])
+    return orders, form, filters.urlencode()
+
+def order_page(request, orders):
+    '''
+    One page of an order history, newest first, narrowed by filter_orders.
+    Seeks on (date, id) so every page uses the (seller, date) / (buyer, date)
+    indexes and costs the same.
+    '''
+    orders, form, filter_query = filter_orders(request, orders)
+    page = keyset_paginate(
+        orders,
+        ['-date', '-id'],
+        get_page_size(request),
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+    return {
+        'orders_list': page.items,
+        'page': page,
+        'filter_form': form,
+        #carried along by the previous/next links
+        'filter_query': filter_query,
+    }
+
+def picked_order_ids(request):
+    #the ticked checkboxes on the order pages, anything that isn't an id is dropped
+    return [int(value) for value in request.POST.getlist('orders') if value.isdigit()]
+
 @login_required
 def buyer_orders(request):
-    orders_list = Order.objects.filter(buyer=request.user).order_by('delivered')
-
-    context = {
-        'orders_list': orders_list
-    }
+    context = order_page(request, Order.objects.filter(buyer=request.user).select_related('book', 'oldListingImage'))
 
     return render(request, 'buyer_orders.html', context=context)
 
 @login_required
 def return_order(request, id):
-    order = get_object_or_404(Order, id=id)
+    #orders that aren't this buyer's, or are already delivered or returned, are left alone
+    if id.isdigit():
+        return_orders(request.user, [int(id)])
+    return redirect('buyer_orders')
 
-    #check if the order is already delivered and if it don't let them return it
-    if order.delivered:
-        return redirect('buyer_orders')
-    else:
-        # if the listing still exits
-        try:
-            oldListing = Listing.objects.get(id=order.oldListingId)
-            oldListing.quantity += order.quantity
-            oldListing.save()
-            order.delete()
-        
-        #if the listing doesn't still exist make a new one
-        except Listing.DoesNotExist:
-            returned_listing = Listing(
-                id = order.oldListingId,
-                listingID = 0,
-                isbn = order.book,
-                quantity = order.quantity,
-                userID = order.seller,
-                price = order.price,
-                image = order.oldListingImage
-            )
-            returned_listing.save()
-            order.delete()
+@login_required
+def bulk_return_orders(request):
+    if request.method == 'POST':
+        returned = return_orders(request.user, picked_order_ids(request))
+        messages.success(request, "%d order(s) returned" % len(returned))
+    return redirect('buyer_orders')
 
-        return redirect('buyer_orders')
-    
 @login_required
 def seller_orders(request):
-    orders_list = Order.objects.filter(seller=request.user).order_by('delivered')
+    stats = seller_stats(request.user)
 
-    total_made = 0
-    for order in orders_list:
-        total_made += order.quantity * order.price
-
-    context = {
-        'orders_list': orders_list,
-        'total_made': round(total_made, 2)
-    }
+    context = order_page(request, Order.objects.filter(seller=request.user).select_related('buyer', 'book', 'oldListingImage'))
+    context.update({
+        'total_made': stats['revenue'],
+        'stats': stats,
+        'daily_stats': recent_daily_stats(request.user, settings.SELLER_STATS_DAYS),
+    })
 
     return render(request, 'seller_orders.html', context=context)
 
 @login_required
-def deliver_order(request, id):
-    order = get_object_or_404(Order, id=id)
+def export_seller_orders(request):
+    #the whole filtered history as a download, streamed a chunk of rows at a time
+    file_format = request.GET.get('format', 'csv')
+    if file_format not in FORMATS:
+        file_format = 'csv'
+    orders, form, filter_query = filter_orders(request, Order.objects.filter(seller=request.user))
+    response = StreamingHttpResponse(
+        export_lines(orders.order_by('-date', '-id'), SELLER_ORDER_FIELDS, file_format),
+        content_type=FORMATS[file_format][1],
+    )
+    response['Content-Disposition'] = 'attachment; filename="orders.%s"' % file_format
+    return response
 
-    #check if the order is already delivered and if it don't let them return it
-    if order.delivered:
-        return redirect('seller_orders')
-    else:
-        
-        order.delivered = True
-        order.save()
+@login_required
+def deliver_order(request, id):
+    #orders that aren't this seller's, or are already delivered or returned, are left alone
+    if id.isdigit():
+        deliver_orders(request.user, [int(id)])
+    return redirect('seller_orders')
 
-        return redirect('seller_orders')
\ No newline at end of file
+@login_required
+def bulk_deliver_orders(request):
+    if request.method == 'POST':
+        delivered = deliver_orders(request.user, picked_order_ids(request))
+        messages.success(request, "%d order(s) marked as delivered" % len(delivered))
+    return redirect('seller_orders')
+
+@staff_member_required
+def cache_stats(request):
+    #catalog cache hit/miss counts for monitoring
+    return JsonResponse(caching.stats())